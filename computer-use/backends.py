@@ -0,0 +1,87 @@
+import asyncio
+import importlib
+import json
+import os
+
+# Environment name to "module:class", modules are imported only when their environment is used
+registry = {
+    "linux_vm": "vm_computer:VMComputer",
+    "local": "local_computer:LocalComputer",
+    "vnc": "vnc_computer:VNCComputer",
+}
+
+GEOMETRY_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "cua", "geometry.json")
+
+
+def register(environment: str, target: str):
+    registry[environment] = target
+
+
+def load(environment: str) -> type:
+    if environment not in registry:
+        raise ValueError(f"Unsupported environment '{environment}'.")
+    module_name, class_name = registry[environment].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class GeometryCache:
+    """Screen sizes of the computers seen in earlier runs, kept in a JSON file."""
+
+    def __init__(self, path: str = GEOMETRY_CACHE):
+        self.path = path
+        self.sizes = {}
+        self.changed = False
+        try:
+            with open(path, encoding="utf-8") as cache_file:
+                self.sizes = json.load(cache_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    def get(self, key: str) -> tuple[int, int] | None:
+        size = self.sizes.get(key)
+        return tuple(size) if size else None
+
+    def put(self, key: str, size: tuple[int, int]):
+        if self.get(key) != tuple(size):
+            self.sizes[key] = list(size)
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(self.sizes, cache_file, indent=2)
+        os.replace(temp_path, self.path)
+        self.changed = False
+
+
+def geometry_key(environment: str, options: dict) -> str:
+    if "hostname" in options:
+        return f"{environment}:{options['hostname']}:{options.get('port', 22)}"
+    return environment
+
+
+async def start(environment: str, scale=None, geometry: GeometryCache | None = None, **options):
+    """Create the computer for environment, connect to it and learn its screen size.
+
+    The import and the connection run on worker threads, so the caller can set up
+    the model client at the same time. scale wraps the computer, e.g. in a Scaler.
+    With a geometry cache the size from an earlier run is used right away and the
+    connection is only warmed up.
+    """
+    computer_class = await asyncio.to_thread(load, environment)
+    computer = await asyncio.to_thread(computer_class, **options)
+    if scale:
+        computer = scale(computer)
+    key = geometry_key(environment, options)
+    size = geometry.get(key) if geometry else None
+    await computer.warm()
+    if size and hasattr(computer, "screen_size"):
+        computer.screen_size = size
+    else:
+        await computer.fetch_dimensions()
+        if geometry and getattr(computer, "screen_size", None):
+            geometry.put(key, computer.screen_size)
+    return computer
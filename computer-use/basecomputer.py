@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from frame import Frame
+
 
 class BaseComputer(ABC):
     @property
@@ -11,8 +13,17 @@ class BaseComputer(ABC):
     def dimensions(self):
         pass
 
+    async def fetch_dimensions(self) -> tuple[int, int]:
+        """Return the screen size, reading it from the computer if it isn't known yet."""
+        return self.dimensions
+
+    async def warm(self) -> None:
+        """Prepare for the next action, e.g. open connections. Optional."""
+        pass
+
     @abstractmethod
-    async def screenshot(self) -> str:
+    async def screenshot(self) -> Frame | str:
+        """Return a Frame, or the base64 encoded PNG like older backends do."""
         pass
 
     @abstractmethod
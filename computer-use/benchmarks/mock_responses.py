@@ -0,0 +1,117 @@
+import asyncio
+import itertools
+import json
+from types import SimpleNamespace
+
+import openai
+
+# Used when no script is given: a short session that exercises every common action
+DEFAULT_SCRIPT = [
+    [{"type": "computer_call", "action": {"type": "screenshot"}}],
+    [{"type": "computer_call", "action": {"type": "click", "x": 200, "y": 150, "button": "left"}}],
+    [{"type": "computer_call", "action": {"type": "type", "text": "hello world"}}],
+    [{"type": "computer_call", "action": {"type": "scroll", "x": 500, "y": 400, "scroll_x": 0, "scroll_y": -3}}],
+    [{"type": "computer_call", "action": {"type": "keypress", "keys": ["ENTER"]}}],
+    [{"type": "message", "text": "Done."}],
+]
+
+
+class MockResponses:
+    """Local stand-in for client.responses that replays scripted outputs with a set latency.
+
+    Every call to create returns the next step of the script. A step is a list of
+    output items in the Responses API shape, where ids, call ids and statuses may be
+    left out and messages may be given as {"type": "message", "text": ...}.
+    """
+
+    def __init__(self, script=None, latency_ms: float = 0, ttfb_ms: float | None = None,
+                 loop: bool = True, input_tokens: int = 1500, output_tokens: int = 50):
+        self.script = script or DEFAULT_SCRIPT
+        self.steps = itertools.cycle(self.script) if loop else iter(self.script)
+        self.latency_ms = latency_ms
+        self.ttfb_ms = latency_ms if ttfb_ms is None else ttfb_ms
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.counter = itertools.count(1)
+        self.requests = 0
+
+    def _item(self, item: dict) -> dict:
+        n = next(self.counter)
+        item = dict(item)
+        item.setdefault("status", "completed")
+        if item["type"] == "computer_call":
+            item.setdefault("id", f"cu_{n}")
+            item.setdefault("call_id", f"call_{n}")
+            item.setdefault("pending_safety_checks", [])
+        elif item["type"] == "function_call":
+            item.setdefault("id", f"fc_{n}")
+            item.setdefault("call_id", f"call_{n}")
+        elif item["type"] == "message":
+            item.setdefault("id", f"msg_{n}")
+            item.setdefault("role", "assistant")
+            if "text" in item:
+                text = item.pop("text")
+                item["content"] = [{"type": "output_text", "text": text, "annotations": []}]
+        elif item["type"] == "reasoning":
+            item.setdefault("id", f"rs_{n}")
+            item.setdefault("summary", [])
+        return item
+
+    def _response(self, output: list[dict], model: str) -> openai.types.responses.Response:
+        response = openai.types.responses.Response.model_validate({
+            "id": f"resp_{next(self.counter)}",
+            "object": "response",
+            "created_at": 0,
+            "model": model,
+            "status": "completed",
+            "output": [self._item(item) for item in output],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+        })
+        # Built without validation since the detail fields differ between SDK versions
+        usage = openai.types.responses.response_usage
+        response.usage = usage.ResponseUsage.model_construct(
+            input_tokens=self.input_tokens,
+            input_tokens_details=usage.InputTokensDetails.model_construct(cached_tokens=0, cache_write_tokens=0),
+            output_tokens=self.output_tokens,
+            output_tokens_details=usage.OutputTokensDetails.model_construct(reasoning_tokens=0),
+            total_tokens=self.input_tokens + self.output_tokens,
+        )
+        return response
+
+    async def create(self, model: str = "mock", stream: bool = False, **kwargs):
+        self.requests += 1
+        response = self._response(next(self.steps), model)
+        if not stream:
+            await asyncio.sleep(self.latency_ms / 1000)
+            return response
+        await asyncio.sleep(self.ttfb_ms / 1000)
+        return self._stream(response)
+
+    async def _stream(self, response):
+        # Spread the remaining latency over the output items
+        remaining = max(0.0, self.latency_ms - self.ttfb_ms) / 1000
+        delay = remaining / max(1, len(response.output))
+        yield SimpleNamespace(type="response.created", response=response)
+        for item in response.output:
+            await asyncio.sleep(delay)
+            yield SimpleNamespace(type="response.output_item.done", item=item)
+        yield SimpleNamespace(type="response.completed", response=response)
+
+
+class MockClient:
+    """Client with only the responses resource, enough for cua.Agent."""
+
+    def __init__(self, script=None, **options):
+        self.responses = MockResponses(script, **options)
+
+
+def load_script(path: str) -> list[list[dict]]:
+    """Load a script from a JSON list of steps or a JSONL file with one step per line."""
+    with open(path, encoding="utf-8") as script_file:
+        text = script_file.read()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
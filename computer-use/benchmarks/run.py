@@ -0,0 +1,186 @@
+"""
+Offline benchmarks for the screenshot pipeline and the agent loop.
+They use a synthetic computer and a scripted stand-in for the Responses API,
+so they run on a headless machine without network access.
+
+Run from the computer-use folder:
+    python -m benchmarks.run --output benchmark.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+
+import cua
+import tracing
+from benchmarks.mock_responses import MockClient, load_script
+from benchmarks.synthetic_computer import SyntheticComputer
+
+
+def stats(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, round(0.95 * len(samples)) - 1)]
+    return {
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(p95, 3),
+    }
+
+
+async def bench_scaler(resolutions, formats, frames: int) -> list[dict]:
+    """Throughput of Scaler.screenshot for each source resolution and output format."""
+    results = []
+    for width, height in resolutions:
+        computer = SyntheticComputer(width, height)
+        for image_format in formats:
+            scaler = cua.Scaler(computer, (1024, 768), image_format=image_format)
+            await scaler.screenshot()
+            samples = []
+            size = 0
+            for _ in range(frames):
+                start = time.perf_counter()
+                screenshot = await scaler.screenshot()
+                samples.append((time.perf_counter() - start) * 1000)
+                size = len(screenshot.base64)
+            results.append({
+                "benchmark": "scaler",
+                "params": {"source": f"{width}x{height}", "format": image_format, "frames": frames},
+                "metrics": stats(samples) | {
+                    "frames_per_sec": round(1000 / statistics.fmean(samples), 2),
+                    "base64_bytes": size,
+                },
+            })
+    return results
+
+
+async def bench_scaler_pool(sessions: int, frames: int, kind: str | None, workers: int | None) -> dict:
+    """Frames per second of concurrent Scalers sharing a worker pool, or the default executor."""
+    pool = cua.ImagePool(workers, kind=kind) if kind else None
+    scalers = [cua.Scaler(SyntheticComputer(1920, 1080, seed=i), (1024, 768), pool=pool) for i in range(sessions)]
+    for scaler in scalers:
+        await scaler.screenshot()
+
+    async def session(scaler):
+        for _ in range(frames):
+            await scaler.screenshot()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(scaler) for scaler in scalers))
+    elapsed = time.perf_counter() - start
+    metrics = {"frames_per_sec": round(sessions * frames / elapsed, 2)}
+    if pool:
+        metrics["mean_queue_ms"] = round(pool.mean_queue_ms, 3)
+        pool.close()
+    return {
+        "benchmark": "scaler_pool",
+        "params": {"sessions": sessions, "frames": frames, "pool": kind or "default", "workers": workers},
+        "metrics": metrics,
+    }
+
+
+async def bench_step_overhead(steps: int, script) -> dict:
+    """Time spent in Agent.continue_task when the model and the computer cost nothing."""
+    tracer = tracing.Tracer()
+    tracing.activate(tracer)
+    computer = cua.Scaler(SyntheticComputer(1920, 1080), (1024, 768))
+    agent = cua.Agent(MockClient(script), "mock", computer)
+    agent.start_task()
+    await agent.continue_task("benchmark")
+    samples = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        await agent.continue_task()
+        samples.append((time.perf_counter() - start) * 1000)
+    tracing.activate(None)
+    phases = {name: round(statistics.median(values), 3) for name, values in tracer.durations.items()}
+    return {
+        "benchmark": "step_overhead",
+        "params": {"steps": steps},
+        "metrics": stats(samples) | {"phase_p50_ms": phases},
+    }
+
+
+async def bench_end_to_end(steps: int, sessions: int, model_latency_ms: float,
+                           capture_latency_ms: float, stream: bool, script) -> dict:
+    """Steps per second for concurrent sessions with simulated model and capture latency."""
+    client = MockClient(script, latency_ms=model_latency_ms, ttfb_ms=model_latency_ms / 4)
+    samples = []
+
+    async def session():
+        computer = SyntheticComputer(1920, 1080, latency_ms=capture_latency_ms)
+        agent = cua.Agent(client, "mock", cua.Scaler(computer, (1024, 768)), stream=stream)
+        agent.start_task()
+        await agent.continue_task("benchmark")
+        for _ in range(steps):
+            start = time.perf_counter()
+            await agent.continue_task()
+            samples.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    return {
+        "benchmark": "end_to_end",
+        "params": {
+            "steps": steps,
+            "sessions": sessions,
+            "model_latency_ms": model_latency_ms,
+            "capture_latency_ms": capture_latency_ms,
+            "stream": stream,
+        },
+        "metrics": stats(samples) | {"steps_per_sec": round(steps * sessions / elapsed, 2)},
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", dest="output", help="Write results as JSON to this file")
+    parser.add_argument("--script", dest="script", help="JSON or JSONL script of model outputs")
+    parser.add_argument("--frames", dest="frames", type=int, default=20,
+        help="Frames per Scaler benchmark")
+    parser.add_argument("--steps", dest="steps", type=int, default=30,
+        help="Steps per agent benchmark")
+    parser.add_argument("--sessions", dest="sessions", type=int, default=4,
+        help="Concurrent sessions in the end-to-end benchmark")
+    parser.add_argument("--workers", dest="workers", type=int,
+        help="Workers of the Scaler pool benchmarks (default: one per core)")
+    parser.add_argument("--model-latency", dest="model_latency", type=float, default=200,
+        help="Simulated model latency in ms")
+    parser.add_argument("--capture-latency", dest="capture_latency", type=float, default=20,
+        help="Simulated capture latency in ms")
+    args = parser.parse_args()
+
+    script = load_script(args.script) if args.script else None
+    results = []
+    results += await bench_scaler([(1024, 768), (1920, 1080), (2560, 1440)], ["png", "jpeg", "webp"], args.frames)
+    for kind in (None, "thread", "process"):
+        results.append(await bench_scaler_pool(args.sessions, args.frames, kind, args.workers))
+    results.append(await bench_step_overhead(args.steps, script))
+    for stream in (False, True):
+        results.append(await bench_end_to_end(args.steps, args.sessions, args.model_latency,
+                                              args.capture_latency, stream, script))
+
+    for result in results:
+        params = " ".join(f"{k}={v}" for k, v in result["params"].items())
+        metrics = result["metrics"]
+        extra = metrics.get("frames_per_sec") or metrics.get("steps_per_sec") or ""
+        p50 = f"p50 {metrics['p50_ms']:>9.2f} ms" if "p50_ms" in metrics else " " * 16
+        print(f"{result['benchmark']:<14} {params:<70} {p50}  {extra}")
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,239 @@
+"""
+Soak test for one process running many agent sessions at once.
+Each concurrency level runs that many sessions for a fixed time against synthetic
+computers and the scripted stand-in for the Responses API, while event loop lag,
+memory and step latency are sampled. The report names the first level where the
+step latency or the loop lag degrades.
+
+Run from the computer-use folder:
+    python -m benchmarks.soak --concurrency 1,4,16,64 --duration 30 --output soak.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import cua
+from benchmarks.mock_responses import MockClient, load_script
+from benchmarks.run import stats
+from benchmarks.synthetic_computer import SyntheticComputer
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process, or the peak where the current one can't be read."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class LagMonitor:
+    """Measure how late the event loop wakes up a task that sleeps for interval_ms."""
+
+    def __init__(self, interval_ms: float = 10):
+        self.interval_ms = interval_ms
+        self.samples = []
+        self.task = None
+
+    async def _run(self):
+        interval = self.interval_ms / 1000
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.samples.append(max(0.0, (time.perf_counter() - start - interval) * 1000))
+
+    def start(self):
+        self.samples = []
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> dict:
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        if not self.samples:
+            return {}
+        return {"lag_" + name: value for name, value in stats(self.samples).items()} | {
+            "lag_max_ms": round(max(self.samples), 3),
+        }
+
+
+async def soak(sessions: int, duration: float, client, args, monitor: LagMonitor, image_pool=None) -> dict:
+    """Run sessions agents until duration seconds have passed and measure the process."""
+    gc.collect()
+    rss_before = rss_bytes()
+    traced_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+    samples = []
+    # Build the sessions first, drawing the synthetic desktops would show up as loop lag
+    agents = []
+    for seed in range(sessions):
+        computer = SyntheticComputer(args.width, args.height, latency_ms=args.capture_latency,
+                                     action_latency_ms=args.action_latency, seed=seed)
+        agents.append(cua.Agent(client, "mock", cua.Scaler(computer, (1024, 768), pool=image_pool),
+                                stream=args.stream))
+    warm_after = time.perf_counter() + duration / 4
+    deadline = time.perf_counter() + duration
+
+    async def session(agent):
+        agent.start_task()
+        await agent.continue_task("soak")
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await agent.continue_task()
+            # Steps of the first quarter only warm up caches and pools
+            if start >= warm_after:
+                samples.append((time.perf_counter() - start) * 1000)
+
+    async def mark_warm():
+        await asyncio.sleep(duration / 4)
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0, rss_bytes()
+
+    monitor.start()
+    warm_marker = asyncio.create_task(mark_warm())
+    started = time.perf_counter()
+    await asyncio.gather(*(session(agent) for agent in agents))
+    del agents
+    elapsed = time.perf_counter() - started
+    lag = await monitor.stop()
+    traced_warm, rss_warm = await warm_marker
+    traced_end = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    rss_end = rss_bytes()
+    measured = elapsed - duration / 4
+
+    metrics = (stats(samples) if samples else {}) | lag | {
+        "steps": len(samples),
+        "steps_per_sec": round(len(samples) / measured, 2) if measured > 0 else 0.0,
+        "rss_mb": round(rss_end / 2**20, 1),
+        "rss_growth_kb_per_session": round((rss_end - rss_warm) / 1024 / sessions, 1),
+    }
+    if tracemalloc.is_tracing():
+        # Growth while running shows leaks per step, what survives the sessions shows retained objects
+        gc.collect()
+        traced_after = tracemalloc.get_traced_memory()[0]
+        metrics["traced_growth_kb_per_session"] = round((traced_end - traced_warm) / 1024 / sessions, 1)
+        metrics["retained_kb_per_session"] = round((traced_after - traced_before) / 1024 / sessions, 1)
+        top = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")[:args.top]
+        metrics["top_growth"] = [
+            {"site": str(stat.traceback), "size_kb": round(stat.size_diff / 1024, 1), "count": stat.count_diff}
+            for stat in top if stat.size_diff > 0
+        ]
+    return {
+        "benchmark": "soak",
+        "params": {
+            "sessions": sessions,
+            "duration_s": duration,
+            "model_latency_ms": args.model_latency,
+            "capture_latency_ms": args.capture_latency,
+            "stream": args.stream,
+            "rss_before_mb": round(rss_before / 2**20, 1),
+        },
+        "metrics": metrics,
+    }
+
+
+def find_saturation(results: list[dict], latency_factor: float, max_lag_ms: float) -> dict | None:
+    """Return the first level whose p95 step latency or p95 loop lag is over the limits.
+
+    The step latency limit is latency_factor times the p95 of the lowest level.
+    """
+    baseline = results[0]["metrics"].get("p95_ms")
+    for result in results:
+        metrics = result["metrics"]
+        reasons = []
+        if baseline and metrics.get("p95_ms", 0) > latency_factor * baseline:
+            reasons.append(f"p95 step latency {metrics['p95_ms']:.1f} ms > {latency_factor} x {baseline:.1f} ms")
+        if metrics.get("lag_p95_ms", 0) > max_lag_ms:
+            reasons.append(f"p95 loop lag {metrics['lag_p95_ms']:.1f} ms > {max_lag_ms} ms")
+        if reasons:
+            return {"sessions": result["params"]["sessions"], "reasons": reasons}
+    return None
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", dest="concurrency", default="1,2,4,8,16,32",
+        help="Comma separated numbers of concurrent sessions, run in this order")
+    parser.add_argument("--duration", dest="duration", type=float, default=20,
+        help="Seconds each concurrency level runs, the first quarter is warm-up")
+    parser.add_argument("--output", dest="output", help="Write results as JSON to this file")
+    parser.add_argument("--script", dest="script", help="JSON or JSONL script of model outputs")
+    parser.add_argument("--model-latency", dest="model_latency", type=float, default=200,
+        help="Simulated model latency in ms")
+    parser.add_argument("--capture-latency", dest="capture_latency", type=float, default=20,
+        help="Simulated capture latency in ms")
+    parser.add_argument("--action-latency", dest="action_latency", type=float, default=0,
+        help="Simulated action latency in ms")
+    parser.add_argument("--width", dest="width", type=int, default=1920)
+    parser.add_argument("--height", dest="height", type=int, default=1080)
+    parser.add_argument("--stream", dest="stream", action="store_true",
+        help="Stream responses from the stand-in")
+    parser.add_argument("--image-workers", dest="image_workers", type=int,
+        help="Scale screenshots on a shared thread pool with this many workers")
+    parser.add_argument("--lag-interval", dest="lag_interval", type=float, default=10,
+        help="Interval in ms of the event loop lag probe")
+    parser.add_argument("--tracemalloc", dest="tracemalloc", action="store_true",
+        help="Track Python allocations to report growth per session and its top sites (slows steps down)")
+    parser.add_argument("--top", dest="top", type=int, default=5,
+        help="Number of allocation sites to report with --tracemalloc")
+    parser.add_argument("--latency-factor", dest="latency_factor", type=float, default=1.5,
+        help="A level degrades when its p95 step latency exceeds the lowest level's by this factor")
+    parser.add_argument("--max-lag", dest="max_lag", type=float, default=50,
+        help="A level degrades when its p95 event loop lag exceeds this many ms")
+    args = parser.parse_args()
+
+    script = load_script(args.script) if args.script else None
+    levels = [int(level) for level in args.concurrency.split(",")]
+    image_pool = cua.ImagePool(args.image_workers) if args.image_workers else None
+    monitor = LagMonitor(args.lag_interval)
+    if args.tracemalloc:
+        tracemalloc.start()
+    results = []
+    for sessions in levels:
+        # One client shared by all sessions like in the orchestrator
+        client = MockClient(script, latency_ms=args.model_latency, ttfb_ms=args.model_latency / 4)
+        result = await soak(sessions, args.duration, client, args, monitor, image_pool)
+        results.append(result)
+        metrics = result["metrics"]
+        line = f"sessions {sessions:>4}  {metrics['steps_per_sec']:>8.2f} steps/s"
+        if "p95_ms" in metrics:
+            line += f"  p50 {metrics['p50_ms']:>8.1f} ms  p95 {metrics['p95_ms']:>8.1f} ms"
+        line += f"  lag p95 {metrics.get('lag_p95_ms', 0):>6.1f} ms  max {metrics.get('lag_max_ms', 0):>6.1f} ms"
+        line += f"  rss {metrics['rss_mb']:>7.1f} MB"
+        if "retained_kb_per_session" in metrics:
+            line += f"  retained {metrics['retained_kb_per_session']:>7.1f} KB/session"
+        print(line, flush=True)
+    if image_pool:
+        image_pool.close()
+
+    saturation = find_saturation(results, args.latency_factor, args.max_lag)
+    if saturation:
+        print(f"Degrades at {saturation['sessions']} sessions: {'; '.join(saturation['reasons'])}")
+    else:
+        print(f"No degradation up to {levels[-1]} sessions")
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": results,
+        "saturation": saturation,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
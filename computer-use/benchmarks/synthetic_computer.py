@@ -0,0 +1,106 @@
+import asyncio
+import collections
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from basecomputer import BaseComputer
+from frame import Frame
+
+
+class SyntheticComputer(BaseComputer):
+    """Serve generated frames at a fixed resolution and record the last actions it receives.
+
+    The frame only changes when an action changes the state of the screen, so
+    repeated screenshots return the same cached bytes like an idle desktop would.
+    """
+
+    def __init__(self, width: int = 1920, height: int = 1080, latency_ms: float = 0,
+                 action_latency_ms: float = 0, seed: int = 0):
+        self.size = (width, height)
+        self.latency_ms = latency_ms
+        self.action_latency_ms = action_latency_ms
+        # Only recent actions and text are kept, so long soak runs don't measure their growth
+        self.action_count = 0
+        self.actions = collections.deque(maxlen=100)
+        self.cursor = (0, 0)
+        self.typed = ""
+        self.frame = None
+        self.background = self._background(random.Random(seed))
+
+    @property
+    def environment(self):
+        return "linux"
+
+    @property
+    def dimensions(self):
+        return self.size
+
+    def _background(self, rng: random.Random) -> Image.Image:
+        # A desktop-like picture: gradient wallpaper with a few windows and text lines
+        width, height = self.size
+        image = Image.linear_gradient("L").resize(self.size).convert("RGB")
+        draw = ImageDraw.Draw(image)
+        for _ in range(6):
+            x0, y0 = rng.randrange(width // 2), rng.randrange(height // 2)
+            x1, y1 = x0 + rng.randrange(200, width // 2), y0 + rng.randrange(150, height // 2)
+            draw.rectangle((x0, y0, x1, y1), fill=(240, 240, 240), outline=(90, 90, 90))
+            draw.rectangle((x0, y0, x1, y0 + 24), fill=(40, 80, 160))
+            for line in range(y0 + 36, y1 - 12, 18):
+                draw.text((x0 + 10, line), "lorem ipsum dolor sit amet " * rng.randrange(1, 4), fill=(0, 0, 0))
+        return image
+
+    def _render(self) -> Frame:
+        if self.frame is None:
+            image = self.background.copy()
+            draw = ImageDraw.Draw(image)
+            x, y = self.cursor
+            draw.rectangle((x - 4, y - 4, x + 4, y + 4), fill=(255, 0, 0))
+            draw.text((10, 10), f"actions: {self.action_count} {self.typed}", fill=(255, 255, 255))
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG", compress_level=1)
+            self.frame = Frame(buffer.getvalue(), "png", self.size)
+        return self.frame
+
+    async def _act(self, action: str, *args, cursor=None):
+        self.action_count += 1
+        self.actions.append((action, args))
+        if cursor is not None:
+            self.cursor = cursor
+        self.frame = None
+        if self.action_latency_ms:
+            await asyncio.sleep(self.action_latency_ms / 1000)
+
+    async def screenshot(self) -> Frame:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if self.frame is None:
+            # Drawn on a thread like a real capture, so it doesn't stall other sessions
+            return await asyncio.to_thread(self._render)
+        return self.frame
+
+    async def click(self, x: int, y: int, button: str = "left") -> None:
+        await self._act("click", x, y, button, cursor=(x, y))
+
+    async def double_click(self, x: int, y: int) -> None:
+        await self._act("double_click", x, y, cursor=(x, y))
+
+    async def scroll(self, x: int, y: int, scroll_x: int, scroll_y: int) -> None:
+        await self._act("scroll", x, y, scroll_x, scroll_y, cursor=(x, y))
+
+    async def type(self, text: str) -> None:
+        self.typed = (self.typed + text)[-80:]
+        await self._act("type", text)
+
+    async def wait(self, ms: int = 1000) -> None:
+        await asyncio.sleep(ms / 1000)
+
+    async def move(self, x: int, y: int) -> None:
+        await self._act("move", x, y, cursor=(x, y))
+
+    async def keypress(self, keys: list[str]) -> None:
+        await self._act("keypress", keys)
+
+    async def drag(self, path: list[tuple[int, int]]) -> None:
+        await self._act("drag", path, cursor=path[-1] if path else None)
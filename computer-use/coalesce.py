@@ -0,0 +1,166 @@
+import collections
+import contextlib
+import inspect
+import math
+
+
+def _segment_distance(point, start, end) -> float:
+    (x, y), (x1, y1), (x2, y2) = point, start, end
+    dx, dy = x2 - x1, y2 - y1
+    if dx == 0 and dy == 0:
+        return math.hypot(x - x1, y - y1)
+    t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+
+def simplify_path(path: list[tuple[int, int]], tolerance: float) -> list[tuple[int, int]]:
+    """Drop the points of path that are within tolerance pixels of the simplified path.
+
+    This is Ramer-Douglas-Peucker with the distance to the segment rather than to
+    the line, so a drag that turns back on itself keeps its turning point.
+    """
+    if len(path) < 3 or tolerance <= 0:
+        return list(path)
+    keep = [False] * len(path)
+    keep[0] = keep[-1] = True
+    ranges = [(0, len(path) - 1)]
+    while ranges:
+        first, last = ranges.pop()
+        farthest, distance = None, tolerance
+        for index in range(first + 1, last):
+            point_distance = _segment_distance(path[index], path[first], path[last])
+            if point_distance > distance:
+                farthest, distance = index, point_distance
+        if farthest is not None:
+            keep[farthest] = True
+            ranges += [(first, farthest), (farthest, last)]
+    return [point for point, kept in zip(path, keep) if kept]
+
+
+class Coalescer:
+    """Wrapper for a computer that merges redundant actions before they reach it.
+
+    Moves and scrolls are held back until the next call shows whether they can be
+    merged into it. Screenshots and every other call send held actions first, so
+    the screen never lags behind the actions that were asked for. Wrap the computer
+    in it before the Scaler, so that tolerance is in screen pixels.
+    """
+
+    def __init__(self, computer, tolerance: float = 2):
+        self.computer = computer
+        self.tolerance = tolerance
+        # Held move or scroll as (action, *args)
+        self.pending = None
+        # Last position the pointer was sent to
+        self.pointer = None
+        self.counts = collections.Counter()
+
+    def __getattr__(self, name):
+        attr = getattr(self.computer, name)
+        if inspect.iscoroutinefunction(attr):
+            async def call(*args, **kwargs):
+                await self.flush()
+                return await attr(*args, **kwargs)
+            return call
+        return attr
+
+    @property
+    def saved(self) -> int:
+        """Number of actions that did not need a backend call."""
+        return self.counts["actions"] - self.counts["sent"]
+
+    def summary(self) -> str:
+        details = [f"{count} {name.replace('_', ' ')}" for name, count in sorted(self.counts.items())
+                   if count and name not in ("actions", "sent")]
+        return (f"Coalescer: {self.counts['sent']} backend calls for {self.counts['actions']} actions"
+                f" ({', '.join(details) or 'nothing merged'})")
+
+    def _near(self, a, b) -> bool:
+        return math.hypot(a[0] - b[0], a[1] - b[1]) <= self.tolerance
+
+    def _batch(self):
+        # Backends that can queue actions send the held one and the next in one round trip
+        batch = getattr(self.computer, "batch", None)
+        return batch() if batch else contextlib.nullcontext()
+
+    async def _send(self, action: str, *args):
+        self.counts["sent"] += 1
+        result = getattr(self.computer, action)(*args)
+        if inspect.isawaitable(result):
+            await result
+
+    async def flush(self):
+        """Send the held move or scroll, if any."""
+        pending, self.pending = self.pending, None
+        if pending is None:
+            return
+        action, x, y, *args = pending
+        if action == "move" and self.pointer == (x, y):
+            self.counts["skipped_moves"] += 1
+            return
+        self.pointer = (x, y)
+        await self._send(action, x, y, *args)
+
+    def _fold_move(self, x: int, y: int):
+        """Drop a held move to about (x, y), the next action moves there anyway."""
+        if self.pending and self.pending[0] == "move" and self._near(self.pending[1:], (x, y)):
+            self.pending = None
+            self.counts["folded_moves"] += 1
+
+    async def _run(self, action: str, *args, pointer: tuple[int, int] | None = None):
+        self.counts["actions"] += 1
+        async with self._batch():
+            await self.flush()
+            await self._send(action, *args)
+        if pointer:
+            self.pointer = pointer
+
+    async def screenshot(self):
+        await self.flush()
+        screenshot = self.computer.screenshot()
+        if inspect.isawaitable(screenshot):
+            screenshot = await screenshot
+        return screenshot
+
+    async def move(self, x: int, y: int) -> None:
+        self.counts["actions"] += 1
+        if self.pending and self.pending[0] == "move":
+            self.counts["merged_moves"] += 1
+        else:
+            await self.flush()
+        self.pending = ("move", x, y)
+
+    async def scroll(self, x: int, y: int, scroll_x: int, scroll_y: int) -> None:
+        self.counts["actions"] += 1
+        if self.pending and self.pending[0] == "scroll" and self._near(self.pending[1:3], (x, y)):
+            _, x, y, held_x, held_y = self.pending
+            self.pending = ("scroll", x, y, held_x + scroll_x, held_y + scroll_y)
+            self.counts["merged_scrolls"] += 1
+            return
+        self._fold_move(x, y)
+        await self.flush()
+        self.pending = ("scroll", x, y, scroll_x, scroll_y)
+
+    async def click(self, x: int, y: int, button: str = "left") -> None:
+        self._fold_move(x, y)
+        await self._run("click", x, y, button, pointer=(x, y))
+
+    async def double_click(self, x: int, y: int) -> None:
+        self._fold_move(x, y)
+        await self._run("double_click", x, y, pointer=(x, y))
+
+    async def drag(self, path: list[tuple[int, int]]) -> None:
+        if path:
+            self._fold_move(*path[0])
+        simplified = simplify_path(path, self.tolerance)
+        self.counts["dropped_drag_points"] += len(path) - len(simplified)
+        await self._run("drag", simplified, pointer=tuple(simplified[-1]) if simplified else None)
+
+    async def type(self, text: str) -> None:
+        await self._run("type", text)
+
+    async def keypress(self, keys: list[str]) -> None:
+        await self._run("keypress", keys)
+
+    async def wait(self, ms: int = 1000) -> None:
+        await self._run("wait", ms)
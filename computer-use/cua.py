@@ -1,33 +1,160 @@
 import asyncio
-import base64
+import concurrent.futures
+import contextlib
+import contextvars
 import inspect
 import io
 import json
-import re
+import os
+import threading
+import time
+from typing import NamedTuple
 
 import openai
-import PIL
+import PIL.Image
+
+from frame import Frame, to_frame
+import ratelimit
+import tracing
+
+
+class ImagePool:
+    """Worker pool shared by Scalers to scale and encode frames off the event loop.
+
+    At most max_pending frames are queued or being processed at a time, further
+    frames wait for a slot. The time a frame waits before a worker picks it up is
+    recorded as the scaler.queue span and in queue_ms.
+    """
+
+    def __init__(self, workers: int | None = None, kind: str = "thread", max_pending: int | None = None):
+        # Without workers, the executors' own defaults
+        if kind == "thread":
+            workers = workers or min(32, (os.cpu_count() or 1) + 4)
+            self.executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="scaler")
+        elif kind == "process":
+            workers = workers or os.cpu_count() or 1
+            self.executor = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            raise ValueError(f"Unsupported pool kind '{kind}'.")
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending or 2 * self.workers
+        self.slots = asyncio.Semaphore(self.max_pending)
+        self.frames = 0
+        self.queue_ms = 0.0
+        self.max_queue_ms = 0.0
+
+    async def run(self, func, *args):
+        submitted = time.perf_counter()
+        async with self.slots:
+            loop = asyncio.get_running_loop()
+            if self.kind == "thread":
+                # Threads keep the tracing context so their spans nest under the caller
+                context = contextvars.copy_context()
+                future = loop.run_in_executor(self.executor, context.run, _timed, func, args)
+            else:
+                future = loop.run_in_executor(self.executor, _timed, func, args)
+            started, result = await future
+        queue_ms = (started - submitted) * 1000
+        self.frames += 1
+        self.queue_ms += queue_ms
+        self.max_queue_ms = max(self.max_queue_ms, queue_ms)
+        tracing.add("scaler.queue", submitted, end=started, kind=self.kind)
+        return result
+
+    @property
+    def mean_queue_ms(self) -> float:
+        return self.queue_ms / self.frames if self.frames else 0.0
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _timed(func, args):
+    return time.perf_counter(), func(*args)
+
+
+# Scalers of a worker process, one per encode policy, so their buffers are reused
+_worker_scalers = {}
+
+
+def _process_in_worker(options: tuple, data: bytes, mode: str | None, size, dimensions) -> Frame:
+    scaler = _worker_scalers.get(options)
+    if scaler is None:
+        scaler = _worker_scalers[options] = Scaler(None, dimensions, *options)
+    if mode is None:
+        screenshot = Frame(data)
+        image = PIL.Image.open(io.BytesIO(data))
+    else:
+        screenshot = None
+        image = PIL.Image.frombytes(mode, size, data)
+    return scaler._process(screenshot, image, dimensions)
 
 
 class Scaler:
     """Wrapper for a computer that performs resizing and coordinate translation."""
 
-    def __init__(self, computer, dimensions: tuple[int, int] | None = None):
+    formats = {"png": "PNG", "jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP"}
+
+    def __init__(
+        self,
+        computer,
+        dimensions: tuple[int, int] | None = None,
+        image_format: str = "png",
+        quality: int = 85,
+        compress_level: int = 6,
+        resample: PIL.Image.Resampling = PIL.Image.Resampling.LANCZOS,
+        pool: ImagePool | None = None,
+    ):
         self.computer = computer
         self.size = dimensions
         self.screen_width = -1
         self.screen_height = -1
+        # Encode policy for the frames sent to the model
+        if image_format.lower() not in self.formats:
+            raise ValueError(f"Unsupported image format '{image_format}'.")
+        self.image_format = self.formats[image_format.lower()]
+        self.quality = quality
+        self.compress_level = compress_level
+        self.resample = resample
+        # Frames are processed on the pool when given, on asyncio's default executor otherwise
+        self.pool = pool
+        # Reused between frames to avoid reallocating for every screenshot
+        self.buffer = io.BytesIO()
+        self.canvas = None
+        self.canvas_content_size = None
+        self.lock = threading.Lock()
 
     @property
     def environment(self):
         return self.computer.environment
 
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.image_format.lower()}"
+
+    @property
+    def screen_size(self) -> tuple[int, int] | None:
+        """Size of the actual screen, known after the first capture or fetch_dimensions."""
+        if self.screen_width > 0:
+            return self.screen_width, self.screen_height
+        return None
+
+    @screen_size.setter
+    def screen_size(self, size: tuple[int, int]):
+        self.screen_width, self.screen_height = size
+
+    async def fetch_dimensions(self) -> tuple[int, int]:
+        """Read the screen size from the computer without waiting for a screenshot."""
+        self.screen_size = await self.computer.fetch_dimensions()
+        return self.dimensions
+
     @property
     def dimensions(self):
         if not self.size:
             # If no dimensions are given, take a screenshot and scale to fit in 2048px
             # https://platform.openai.com/docs/guides/images
-            width, height = self.computer.dimensions
+            width, height = self.screen_size or self.computer.dimensions
             max_size = 2048
             longest = max(width, height)
             if longest <= max_size:
@@ -37,27 +164,88 @@ class Scaler:
                 self.size = (int(width * scale), int(height * scale))
         return self.size
 
-    async def screenshot(self) -> str:
-        # Take a screenshot from the actual computer
-        screenshot = await self.computer.screenshot()
-        screenshot = base64.b64decode(screenshot)
-        buffer = io.BytesIO(screenshot)
-        image = PIL.Image.open(buffer)
+    async def screenshot(self) -> Frame:
+        return await self.process(await self.capture())
+
+    async def capture(self):
+        """Take a screenshot from the actual computer without scaling or encoding it."""
+        if hasattr(self.computer, "grab"):
+            # Raw frames skip the encode on the computer side and the decode here
+            with tracing.span("computer.capture"):
+                image = await self.computer.grab()
+            self.screen_width, self.screen_height = image.size
+            return None, image
+        if hasattr(self.computer, "set_target") and (self.size or self.screen_size):
+            # Have the computer scale and encode the frame, process() then passes it through
+            level = self.compress_level if self.image_format == "PNG" else self.quality
+            self.computer.set_target(self.dimensions, self.image_format, level)
+        with tracing.span("computer.capture"):
+            screenshot = to_frame(await self.computer.screenshot())
+        image = PIL.Image.open(io.BytesIO(screenshot.data))
+        # Only the header is read here, which is enough to map coordinates
+        self.screen_width, self.screen_height = screenshot.source_size or image.size
+        return screenshot, image
+
+    async def process(self, frame) -> Frame:
+        """Scale and encode a captured frame on a worker thread or process."""
+        screenshot, image = frame
+        dimensions = self.dimensions
+        if screenshot is not None and image.size == tuple(dimensions) and image.format == self.image_format:
+            # Already in the target size and format, nothing to do
+            screenshot.size = image.size
+            return screenshot
+        with tracing.span("scaler.process"):
+            if self.pool is None:
+                return await asyncio.to_thread(self._process, screenshot, image, dimensions)
+            if self.pool.kind == "thread":
+                return await self.pool.run(self._process, screenshot, image, dimensions)
+            # Processes get plain bytes, images and locks can't be sent to them
+            options = (self.image_format.lower(), self.quality, self.compress_level, self.resample)
+            if screenshot is None:
+                args = (image.tobytes(), image.mode, image.size)
+            else:
+                args = (bytes(screenshot.data), None, None)
+            return await self.pool.run(_process_in_worker, options, *args, dimensions)
+
+    def _process(self, screenshot, image, dimensions) -> Frame:
         # Scale the screenshot
-        self.screen_width, self.screen_height = image.size
-        width, height = self.dimensions
-        ratio = min(width / self.screen_width, height / self.screen_height)
-        new_width = int(self.screen_width * ratio)
-        new_height = int(self.screen_height * ratio)
+        width, height = dimensions
+        ratio = min(width / image.width, height / image.height)
+        new_width = int(image.width * ratio)
+        new_height = int(image.height * ratio)
         new_size = (new_width, new_height)
-        resized_image = image.resize(new_size, PIL.Image.Resampling.LANCZOS)
-        image = PIL.Image.new("RGB", (width, height), (0, 0, 0))
-        image.paste(resized_image, (0, 0))
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        buffer.seek(0)
-        data = bytearray(buffer.getvalue())
-        return base64.b64encode(data).decode("utf-8")
+        with self.lock:
+            if screenshot is not None:
+                with tracing.span("scaler.decode", bytes=len(screenshot)):
+                    image.load()
+            if new_size != image.size:
+                with tracing.span("scaler.resize"):
+                    image = image.resize(new_size, self.resample)
+            if new_size != (width, height):
+                if self.canvas is None or self.canvas_content_size != new_size or self.canvas.size != (width, height):
+                    self.canvas = PIL.Image.new("RGB", (width, height), (0, 0, 0))
+                    self.canvas_content_size = new_size
+                self.canvas.paste(image, (0, 0))
+                image = self.canvas
+            return self._encode(image)
+
+    def _encode(self, image) -> Frame:
+        if self.image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        if self.image_format == "PNG":
+            options = {"compress_level": self.compress_level}
+        else:
+            options = {"quality": self.quality}
+        with tracing.span("scaler.encode", format=self.image_format) as span:
+            self.buffer.seek(0)
+            self.buffer.truncate()
+            image.save(self.buffer, format=self.image_format, **options)
+            span.set(bytes=self.buffer.tell())
+            # The buffer is reused for the next frame, so the frame needs its own copy
+            return Frame(self.buffer.getvalue(), self.image_format.lower(), image.size)
+
+    async def warm(self) -> None:
+        await self.computer.warm()
 
     async def click(self, x: int, y: int, button: str = "left") -> None:
         x, y = self._point_to_screen_coords(x, y)
@@ -90,26 +278,96 @@ class Scaler:
 
     def _point_to_screen_coords(self, x, y):
         width, height = self.dimensions
-        ratio = min(width / self.screen_width, height / self.screen_height)
+        # Actions can come before the first screenshot, e.g. right after a replayed step
+        screen_width, screen_height = self.screen_size or self.computer.dimensions
+        ratio = min(width / screen_width, height / screen_height)
         x = x / ratio
         y = y / ratio
         return int(x), int(y)
 
 
+# Sync tools run here rather than on asyncio's default executor, which the Scaler and
+# the backends use, so slow tools can't hold up screenshots and connections
+_tool_executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="agent-tool")
+
+
+class IncompleteResponseError(RuntimeError):
+    """Raised when a request ends without a completed response."""
+
+    def __init__(self, response=None, error_event=None):
+        self.response = response
+        self.error_event = error_event
+        self.status = response.status if response is not None else None
+        if response is not None:
+            details = f"status '{response.status}'"
+            if getattr(response, "error", None):
+                details += f": {response.error.code}: {response.error.message}"
+            elif getattr(response, "incomplete_details", None):
+                details += f": {response.incomplete_details.reason}"
+        elif error_event is not None:
+            details = f"error event: {error_event.code}: {error_event.message}"
+        else:
+            details = "the stream ended before the response was done"
+        super().__init__(f"The model did not complete the response, {details}")
+
+
+class FunctionTool(NamedTuple):
+    """A function tool registered with Agent.add_tool."""
+
+    tool: dict
+    func: object
+    timeout: float | None
+    # Limits the calls of this tool running at once, None for no limit
+    slots: asyncio.Semaphore | None
+
+
+def _payload_bytes(inputs: list) -> int:
+    """Size of inputs as JSON, without serializing the screenshots.
+
+    Data URLs need no escaping in JSON, so their length is added as is.
+    """
+    size = 0
+    for item in inputs:
+        output = item.get("output") if isinstance(item, dict) else None
+        if isinstance(output, dict) and isinstance(output.get("image_url"), str):
+            size += len(output["image_url"])
+            item = {**item, "output": {**output, "image_url": ""}}
+        size += len(json.dumps(item, default=str)) + 2
+    # Brackets around the items, minus the separator after the last one
+    return size if inputs else 2
+
+
 class Agent:
     """CUA agent to start and continue task execution"""
 
-    def __init__(self, client, model: str, computer, logger=None):
+    def __init__(self, client, model: str, computer, logger=None, settle=None, rate_limiter=None,
+                 stream: bool = False, recorder=None):
         self.client = client
         self.model = model
         self.computer = computer
         self.logger = logger
+        self.settle = settle
+        self.settle_reports = []
+        # Share one limiter between Agents that use the same deployment
+        self.rate_limiter = rate_limiter or ratelimit.RateLimiter()
+        self.stream = stream
+        self.warm_task = None
+        self.recorder = recorder
+        self.step = 0
+        self.step_record = None
         self.tools = {}
-        self.repsonse = None
+        self.response = None
+
+    def add_tool(self, tool: dict, func, timeout: float | None = None, max_concurrency: int | None = None):
+        """Register a function tool that the model can call.
 
-    def add_tool(self, tool: dict, func):
+        func may be sync or async, sync functions run on a thread. Calls taking
+        longer than timeout seconds fail, and at most max_concurrency calls of this
+        tool run at once. Failures are returned to the model as the tool output.
+        """
         name = tool["name"]
-        self.tools[name] = (tool, func)
+        slots = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.tools[name] = FunctionTool(tool, func, timeout, slots)
 
     @property
     def requires_user_input(self) -> bool:
@@ -145,100 +403,336 @@ class Agent:
 
     @property
     def actions(self):
-        actions = []
-        for item in self.response.output:
-            if item.type == "computer_call":
-                action_args = vars(item.action) | {}
-                action = action_args.pop("type")
-                if action == "drag":
-                    path = [(point.x, point.y) for point in item.action.path]
-                    action_args["path"] = path
-                actions.append((action, action_args))
-        return actions
+        items = [item for item in self.response.output if item.type == "computer_call"]
+        return [self.call_action(item) for item in items]
+
+    @staticmethod
+    def call_action(item):
+        # Newer SDKs add optional fields, only pass the ones that are set
+        action_args = {key: value for key, value in vars(item.action).items() if value is not None}
+        action = action_args.pop("type")
+        if action == "drag":
+            path = [(point.x, point.y) for point in item.action.path]
+            action_args["path"] = path
+        return action, action_args
 
     def start_task(self):
         self.response = None
 
-    async def continue_task(self, user_message=""):
-        inputs = []
-        screenshot = ""
+    async def _settle(self, timeout_ms: int | None = None):
+        # Poll the unscaled computer so probes skip the resize and encode
+        computer = getattr(self.computer, "computer", self.computer)
+        with tracing.span("agent.settle") as span:
+            report = await self.settle.wait(computer, timeout_ms=timeout_ms)
+            span.set(frames=report.frames, settled=report.settled)
+        self.settle_reports.append(report)
+        if self.logger:
+            state = "Settled" if report.settled else "Settle timed out"
+            message = f"{state} after {report.elapsed_ms:.0f} ms ({report.frames} frames)."
+            self.logger.debug(message)
+
+    async def _run_action(self, action: str, action_args: dict):
+        if action == "wait" and self.settle:
+            # Return as soon as the screen is stable instead of sleeping
+            await self._settle(timeout_ms=action_args.get("ms", 1000))
+            return
+        method = getattr(self.computer, action)
+        with tracing.span("agent.action", action=action):
+            result = method(**action_args)
+            if inspect.isawaitable(result):
+                result = await result
+        if self.settle:
+            await self._settle()
+
+    async def _capture(self) -> asyncio.Future:
+        """Capture the screen now and finish post-processing it in the background."""
+        if hasattr(self.computer, "capture"):
+            frame = await self.computer.capture()
+            return asyncio.ensure_future(self.computer.process(frame))
+        with tracing.span("computer.capture"):
+            screenshot = self.computer.screenshot()
+            if inspect.isawaitable(screenshot):
+                screenshot = await screenshot
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(screenshot)
+        return future
+
+    async def _call_tool(self, tool: FunctionTool, tool_args: dict):
+        if not inspect.iscoroutinefunction(tool.func):
+            result = await self._call_sync_tool(tool, tool_args)
+            if inspect.isawaitable(result):
+                result = await asyncio.wait_for(result, tool.timeout)
+            return result
+        async with tool.slots or contextlib.nullcontext():
+            return await asyncio.wait_for(tool.func(**tool_args), tool.timeout)
+
+    async def _call_sync_tool(self, tool: FunctionTool, tool_args: dict):
+        """Run a sync tool on a thread so it doesn't block the event loop."""
+        loop = asyncio.get_running_loop()
+        if tool.slots:
+            await tool.slots.acquire()
+        try:
+            # The thread keeps the tracing context so its spans nest under the call
+            future = _tool_executor.submit(contextvars.copy_context().run, tool.func, **tool_args)
+        except BaseException:
+            if tool.slots:
+                tool.slots.release()
+            raise
+        if tool.slots:
+            # A thread can't be stopped, so the slot stays taken until it is done, also
+            # after the wait for it timed out
+            def release(_):
+                with contextlib.suppress(RuntimeError):
+                    loop.call_soon_threadsafe(tool.slots.release)
+            future.add_done_callback(release)
+        return await asyncio.wait_for(asyncio.wrap_future(future), tool.timeout)
+
+    async def _run_function_call(self, item):
+        """Run a function tool and return its output, or the error it failed with.
+
+        Errors are returned to the model as {"error": {"type": ..., "message": ...}}
+        so that it can react to them instead of the step failing.
+        """
         response_input_param = openai.types.responses.response_input_param
-        previous_response = self.response
-        previous_response_id = None
-        if previous_response:
-            previous_response_id = previous_response.id
-            for item in previous_response.output:
+        tool_name = item.name
+        with tracing.span("agent.tool", tool=tool_name) as span:
+            try:
+                if tool_name not in self.tools:
+                    raise ValueError(f"Unsupported tool '{tool_name}'.")
+                tool = self.tools[tool_name]
+                tool_args = json.loads(item.arguments)
+                try:
+                    result = await self._call_tool(tool, tool_args)
+                except asyncio.TimeoutError:
+                    # A sync tool keeps running on its thread and its slot, only the wait is given up
+                    raise TimeoutError(f"Tool '{tool_name}' timed out after {tool.timeout} seconds.") from None
+                output = json.dumps(result)
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"Tool '{tool_name}' failed: {e}")
+                span.set(error=type(e).__name__)
+                output = json.dumps({"error": {"type": type(e).__name__, "message": str(e)}})
+        return response_input_param.FunctionCallOutput(
+            type="function_call_output",
+            call_id=item.call_id,
+            output=output,
+        )
+
+    async def _execute(self, output) -> list:
+        """Run the calls of a response in order and collect their outputs."""
+        results = []
+        screenshot = None
+        try:
+            for item in output:
                 if item.type == "computer_call":
-                    action, action_args = self.actions[0]
-                    method = getattr(self.computer, action)
-                    if action != "screenshot":
-                        result = method(**action_args)
-                        if inspect.isawaitable(result):
-                            result = await result
-                    screenshot = self.computer.screenshot()
-                    if inspect.isawaitable(screenshot):
-                        screenshot = await screenshot
-                    output = response_input_param.ComputerCallOutput(
-                        type="computer_call_output",
-                        call_id=item.call_id,
-                        output=response_input_param.ResponseComputerToolCallOutputScreenshotParam(
-                            type="computer_screenshot",
-                            image_url=f"data:image/png;base64,{screenshot}",
-                        ),
-                        acknowledged_safety_checks=self.pending_safety_checks,
-                    )
-                    inputs.append(output)
+                    action, action_args = self.call_action(item)
+                    # A screenshot action can reuse the frame of the previous call
+                    if action != "screenshot" or screenshot is None:
+                        if action != "screenshot":
+                            await self._run_action(action, action_args)
+                        screenshot = await self._capture()
+                    results.append((item, screenshot))
                 elif item.type == "function_call":
-                    tool_name = item.name
-                    tool_args = json.loads(item.arguments)
-                    if tool_name not in self.tools:
-                        raise ValueError(f"Unsupported tool '{tool_name}'.")
-                    tool, func = self.tools[tool_name]
-                    result = func(**tool_args)
-                    if inspect.isawaitable(result):
-                        result = await result
-                    output = response_input_param.FunctionCallOutput(
-                        type="function_call_output",
-                        call_id=item.call_id,
-                        output=json.dumps(result),
-                    )
-                    inputs.append(output)
+                    # Tools run concurrently with each other and with the computer calls
+                    results.append(asyncio.ensure_future(self._run_function_call(item)))
                 elif item.type == "reasoning" or item.type == "message":
                     pass
                 else:
                     message = (f"Unsupported response output type '{item.type}'.",)
                     raise NotImplementedError(message)
-        if user_message:
-            message = response_input_param.Message(role="user", content=user_message)
-            inputs.append(message)
+        except BaseException:
+            for result in results:
+                if isinstance(result, asyncio.Future):
+                    result.cancel()
+            raise
+        return results
+
+    async def _finish_outputs(self, results) -> list:
+        """Wait for pending screenshots and build the computer call outputs."""
+        response_input_param = openai.types.responses.response_input_param
+        image_format = getattr(self.computer, "mime_type", "image/png").split("/")[-1]
+        inputs = []
+        for result in results:
+            if isinstance(result, asyncio.Future):
+                # Outputs stay in call order however the tools finish
+                with tracing.span("agent.tool_wait"):
+                    inputs.append(await result)
+                continue
+            if not isinstance(result, tuple):
+                inputs.append(result)
+                continue
+            item, screenshot = result
+            with tracing.span("agent.screenshot_wait"):
+                screenshot = to_frame(await screenshot, image_format)
+            if self.recorder:
+                action, action_args = self.call_action(item)
+                frame = self.recorder.add_frame(screenshot)
+                call = {"call_id": item.call_id, "action": action, "args": action_args, "frame": frame}
+                self.step_record["calls"].append(call)
+            output = response_input_param.ComputerCallOutput(
+                type="computer_call_output",
+                call_id=item.call_id,
+                output=response_input_param.ResponseComputerToolCallOutputScreenshotParam(
+                    type="computer_screenshot",
+                    image_url=screenshot.data_url,
+                ),
+                acknowledged_safety_checks=item.pending_safety_checks,
+            )
+            inputs.append(output)
+        return inputs
+
+    async def _prepare_request(self, user_message="") -> dict:
+        """Run the calls of the previous response and build the next request."""
+        self.settle_reports = []
+        self.step += 1
+        self.step_record = {"step": self.step, "time": time.time(), "user_message": user_message, "calls": []}
+        results = []
+        response_input_param = openai.types.responses.response_input_param
+        previous_response = self.response
+        previous_response_id = None
+        if previous_response:
+            previous_response_id = previous_response.id
+            start = time.perf_counter()
+            with tracing.span("agent.execute"):
+                results = await self._execute(previous_response.output)
+            self.step_record["execute_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        with tracing.span("agent.build_request") as span:
+            if user_message:
+                message = response_input_param.Message(role="user", content=user_message)
+                results.append(message)
+            tools = self.get_tools()
+            inputs = await self._finish_outputs(results)
+            if tracing.enabled():
+                span.set(payload_bytes=_payload_bytes(inputs))
         self.response = None
-        wait = 0
-        for _ in range(10):
+        return dict(
+            model=self.model,
+            input=inputs,
+            previous_response_id=previous_response_id,
+            tools=tools,
+            reasoning={"generate_summary": "concise"},
+            truncation="auto",
+            stream=self.stream,
+        )
+
+    async def continue_task(self, user_message=""):
+        async for _ in self.stream_task(user_message):
+            pass
+
+    async def stream_task(self, user_message=""):
+        """Continue the task and yield output items as soon as the model finishes each one.
+
+        Without streaming enabled the items are yielded once the whole response is done.
+        """
+        step_start = time.perf_counter()
+        request = await self._prepare_request(user_message)
+        limiter = self.rate_limiter
+        # Responses served from a replay cache don't count against the rate limits
+        cached = getattr(self.client, "cached", None)
+        replayed = bool(cached and cached(request))
+        for attempt in range(limiter.max_retries + 1):
+            reserved = 0
+            if not replayed:
+                with tracing.span("agent.rate_limit"):
+                    reserved = await limiter.acquire()
+            yielded = False
+            error_event = None
+            start = time.perf_counter()
             try:
-                await asyncio.sleep(wait)
-                self.response = self.client.responses.create(
-                    model=self.model,
-                    input=inputs,
-                    previous_response_id=previous_response_id,
-                    tools=self.get_tools(),
-                    reasoning={"generate_summary": "concise"},
-                    truncation="auto",
-                )
-                if inspect.isawaitable(self.response):
-                    self.response = await self.response
-                assert self.response.status == "completed"
-                return
-            except openai.RateLimitError as e:
-                match = re.search(r"Please try again in (\d+)s", e.message)
-                wait = int(match.group(1)) if match else 10
+                response = await self._create(request)
+                # For streams, time to first byte is when the first event arrives
+                first_byte = None if self.stream else time.perf_counter()
+                if not self.stream:
+                    self.response = response
+                else:
+                    async for event in response:
+                        if first_byte is None:
+                            first_byte = time.perf_counter()
+                        if event.type == "response.output_item.done":
+                            if event.item.type == "computer_call":
+                                self._warm()
+                            yielded = True
+                            yield event.item
+                        elif event.type in ("response.completed", "response.incomplete", "response.failed"):
+                            self.response = event.response
+                        elif event.type == "error":
+                            error_event = event
+            except ratelimit.RETRYABLE_ERRORS as e:
+                # A rejected request uses no tokens, the retry reserves them again
+                limiter.release(reserved)
+                # Items already handed out can't be taken back, so only retry before that
+                if yielded or attempt == limiter.max_retries:
+                    if self.logger:
+                        self.logger.critical("Max retries exceeded.")
+                    message = f"Request failed after {attempt + 1} attempts: {e}"
+                    raise ratelimit.RetriesExhaustedError(message, e) from e
+                wait = limiter.backoff(attempt, e)
                 if self.logger:
-                    message = f"Rate limit exceeded. Waiting for {wait} seconds."
+                    message = f"{type(e).__name__}. Retrying in {wait:.1f} seconds."
                     self.logger.info(message)
-        if self.logger:
-            self.logger.critical("Max retries exceeded.")
+                await asyncio.sleep(wait)
+                continue
+            if self.response is None:
+                limiter.release(reserved)
+                raise IncompleteResponseError(error_event=error_event)
+            usage = {}
+            if self.response.usage:
+                if not replayed:
+                    limiter.record_usage(reserved, self.response.usage.total_tokens)
+                usage = {
+                    "input_tokens": self.response.usage.input_tokens,
+                    "output_tokens": self.response.usage.output_tokens,
+                }
+            if self.response.status != "completed":
+                raise IncompleteResponseError(self.response, error_event)
+            ttfb_ms = (first_byte - start) * 1000
+            tracing.add("model.request", start, model=self.model, ttfb_ms=round(ttfb_ms, 3),
+                        attempts=attempt + 1, replayed=replayed, **usage)
+            tracing.add("agent.step", step_start)
+            if self.recorder:
+                self._record_step(request, start, ttfb_ms, usage)
+            if not self.stream:
+                for item in self.response.output:
+                    yield item
+            return
+
+    def _record_step(self, request: dict, request_start: float, ttfb_ms: float, usage: dict):
+        record = self.step_record
+        record["response_id"] = self.response.id
+        record["previous_response_id"] = request["previous_response_id"]
+        record["tool_outputs"] = [
+            {"call_id": item["call_id"], "output": item["output"]}
+            for item in request["input"] if item.get("type") == "function_call_output"
+        ]
+        record["settle"] = [report._asdict() for report in self.settle_reports]
+        record["model_ms"] = round((time.perf_counter() - request_start) * 1000, 3)
+        record["ttfb_ms"] = round(ttfb_ms, 3)
+        record["usage"] = usage
+        record["output"] = [item.model_dump(mode="json") for item in self.response.output]
+        self.recorder.record_step(record)
+
+    def _warm(self):
+        # Get the computer ready while the rest of the response is still streaming
+        warm = getattr(self.computer, "warm", None)
+        if warm and (self.warm_task is None or self.warm_task.done()):
+            self.warm_task = asyncio.ensure_future(warm())
+
+    async def _create(self, request: dict):
+        raw_client = getattr(self.client.responses, "with_raw_response", None)
+        if raw_client is None:
+            response = self.client.responses.create(**request)
+            if inspect.isawaitable(response):
+                response = await response
+            return response
+        # Read the raw response so the limiter can see the rate limit headers
+        raw = raw_client.create(**request)
+        if inspect.isawaitable(raw):
+            raw = await raw
+        self.rate_limiter.update(raw.headers)
+        return raw.parse()
 
     def get_tools(self) -> list[openai.types.responses.tool_param.ToolParam]:
-        tools = [entry[0] for entry in self.tools.values()]
+        tools = [entry.tool for entry in self.tools.values()]
         return [self.computer_tool(), *tools]
 
     def computer_tool(self) -> openai.types.responses.ComputerToolParam:
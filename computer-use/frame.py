@@ -0,0 +1,74 @@
+import base64
+
+mime_types = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+class Frame:
+    """An encoded screenshot that is turned into base64 or a data URL only once, when asked.
+
+    Backends used to return base64 strings. Frame converts to the same string with
+    str(), and to_frame accepts either, so both kinds of backends keep working.
+    """
+
+    def __init__(self, data: bytes | memoryview | None, format: str = "png",
+                 size: tuple[int, int] | None = None, encoded: str | None = None,
+                 source_size: tuple[int, int] | None = None):
+        if data is None and encoded is None:
+            raise ValueError("A frame needs either data or its base64 encoding.")
+        self._data = data
+        self.format = format.lower()
+        self.size = size
+        # Size of the screen when the frame was scaled before it got here
+        self.source_size = source_size
+        self._base64 = encoded
+        self._data_url = None
+
+    @classmethod
+    def from_base64(cls, encoded: str, format: str = "png") -> "Frame":
+        return cls(None, format, encoded=encoded)
+
+    @property
+    def data(self) -> bytes | memoryview:
+        """The encoded image bytes."""
+        if self._data is None:
+            self._data = base64.b64decode(self.base64)
+        return self._data
+
+    @property
+    def mime_type(self) -> str:
+        return mime_types.get(self.format, f"image/{self.format}")
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is not None:
+            return self._base64
+        if self._data_url is not None:
+            # Only the data URL is kept once it exists, so cut the base64 text out of it
+            return self._data_url[self._data_url.index(",") + 1:]
+        self._base64 = base64.b64encode(self._data).decode("ascii")
+        return self._base64
+
+    @property
+    def data_url(self) -> str:
+        if self._data_url is None:
+            self._data_url = f"data:{self.mime_type};base64,{self.base64}"
+            # The URL contains the base64 text, keeping both would hold it twice
+            self._base64 = None
+        return self._data_url
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __str__(self) -> str:
+        return self.base64
+
+    def __repr__(self) -> str:
+        size = f"{self.size[0]}x{self.size[1]}" if self.size else "unknown size"
+        return f"<Frame {self.format} {size}>"
+
+
+def to_frame(screenshot, format: str = "png") -> Frame:
+    """Wrap the base64 string returned by older backends in a Frame."""
+    if isinstance(screenshot, Frame):
+        return screenshot
+    return Frame.from_base64(screenshot, format)
@@ -1,16 +1,43 @@
 import asyncio
-import base64
+import concurrent.futures
+import contextvars
 import io
 import platform
-import pyautogui
+import PIL.Image
 
 from basecomputer import BaseComputer
+from frame import Frame
+import local_input
+import screen_capture
+import tracing
 
 class LocalComputer(BaseComputer):
-    """Use pyautogui to take screenshots and perform actions on the local computer."""
+    """Take screenshots and perform actions on the local computer.
 
-    def __init__(self):
-        self.size = None
+    All screen and input calls run in order on one worker thread, so slow ones like
+    drag animations don't block the event loop. Cancelling a call that is still
+    queued drops it, a call that has started runs to the end.
+    """
+
+    def __init__(self, capture: str = "auto", input_backend: str = "auto",
+                 input_profile: str | local_input.InputProfile = "humanlike"):
+        self.worker = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="local-computer")
+        # Backends for screenshots and input, see screen_capture.create and local_input.create.
+        # They're created on the worker since X connections must stay on one thread.
+        self.grabber = self.worker.submit(screen_capture.create, capture).result()
+        self.input = self.worker.submit(local_input.create, input_backend, input_profile).result()
+        # Read now, later the worker may be busy with a long action
+        self.size = self.worker.submit(self.grabber.size).result()
+
+    async def _run(self, func, *args):
+        """Queue func on the worker thread and wait for it to finish."""
+        context = contextvars.copy_context()
+        return await asyncio.wrap_future(self.worker.submit(context.run, func, *args))
+
+    async def close(self):
+        await self._run(self.grabber.close)
+        await self._run(self.input.close)
+        self.worker.shutdown()
 
     @property
     def environment(self):
@@ -27,68 +54,62 @@ class LocalComputer(BaseComputer):
     @property
     def dimensions(self):
         if not self.size:
-            screenshot = pyautogui.screenshot()
-            self.size = screenshot.size
+            self.size = self.worker.submit(self.grabber.size).result()
         return self.size
 
-    async def screenshot(self) -> str:
-        screenshot = pyautogui.screenshot()
-        self.size = screenshot.size
+    async def grab(self, region: tuple[int, int, int, int] | None = None) -> PIL.Image.Image:
+        """Grab the screen or a (left, top, width, height) region of it as a raw RGB image."""
+        with tracing.span("local.grab", backend=self.grabber.name):
+            image = await self._run(self.grabber.grab, region)
+        if region is None:
+            self.size = image.size
+        return image
+
+    async def screenshot(self, region: tuple[int, int, int, int] | None = None) -> Frame:
+        screenshot = await self.grab(region)
         buffer = io.BytesIO()
-        screenshot.save(buffer, format="PNG")
-        buffer.seek(0)
-        data = bytearray(buffer.getvalue())
-        return base64.b64encode(data).decode("utf-8")
-    
+        with tracing.span("local.encode"):
+            # Not on the worker, input queued behind the screenshot shouldn't wait for the encode
+            await asyncio.to_thread(screenshot.save, buffer, format="PNG")
+        return Frame(buffer.getvalue(), "png", screenshot.size)
+
+    async def _pause(self):
+        if self.input.profile.pause:
+            await asyncio.sleep(self.input.profile.pause)
+
     async def click(self, x: int, y: int, button: str = "left") -> None:
-        width, height = self.size
+        width, height = self.dimensions
         if 0 <= x < width and 0 <= y < height:
             button = "middle" if button == "wheel" else button
-            pyautogui.moveTo(x, y, duration=0.1)
-            pyautogui.click(x, y, button=button)
+            await self._run(self.input.click, x, y, button)
+            await self._pause()
 
     async def double_click(self, x: int, y: int) -> None:
-        width, height = self.size
+        width, height = self.dimensions
         if 0 <= x < width and 0 <= y < height:
-            pyautogui.moveTo(x, y, duration=0.1)
-            pyautogui.doubleClick(x, y)
+            await self._run(self.input.double_click, x, y)
+            await self._pause()
 
     async def scroll(self, x: int, y: int, scroll_x: int, scroll_y: int) -> None:
-        pyautogui.scroll(-scroll_y, x=x, y=y)
-        pyautogui.hscroll(scroll_x, x=x, y=y)
+        await self._run(self.input.scroll, x, y, scroll_x, scroll_y)
+        await self._pause()
 
     async def type(self, text: str) -> None:
-        pyautogui.write(text)
+        await self._run(self.input.type, text)
+        await self._pause()
 
     async def wait(self, ms: int = 1000) -> None:
         await asyncio.sleep(ms / 1000)
 
     async def move(self, x: int, y: int) -> None:
-        pyautogui.moveTo(x, y, duration=0.1)
+        await self._run(self.input.move, x, y)
+        await self._pause()
 
     async def keypress(self, keys: list[str]) -> None:
-        keys = [key.lower() for key in keys]
-        keymap = {
-            "arrowdown": "down",
-            "arrowleft": "left",
-            "arrowright": "right",
-            "arrowup": "up",
-        }
-        keys = [keymap.get(key, key) for key in keys]
-        for key in keys:
-            pyautogui.keyDown(key)
-        for key in keys:
-            pyautogui.keyUp(key)
+        await self._run(self.input.keypress, keys)
+        await self._pause()
 
     async def drag(self, path: list[tuple[int, int]]) -> None:
-        if len(path) <= 1:
-            pass
-        elif len(path) == 2:
-            pyautogui.moveTo(*path[0], duration=0.5)
-            pyautogui.dragTo(*path[1], duration=1.0, button="left")
-        else:
-            pyautogui.moveTo(*path[0], duration=0.5)
-            pyautogui.mouseDown(button="left")
-            for point in path[1:]:
-                pyautogui.dragTo(*point, duration=1.0, mouseDownUp=False)
-            pyautogui.mouseUp(button="left")
+        if len(path) > 1:
+            await self._run(self.input.drag, path)
+            await self._pause()
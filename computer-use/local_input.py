@@ -0,0 +1,275 @@
+import sys
+from typing import NamedTuple
+
+
+class InputProfile(NamedTuple):
+    """Timing of the input sent to the local computer, all in seconds."""
+
+    move_duration: float
+    drag_duration: float
+    type_interval: float
+    pause: float
+
+
+profiles = {
+    # Jump straight to the target, for dedicated automation machines
+    "instant": InputProfile(move_duration=0.0, drag_duration=0.0, type_interval=0.0, pause=0.0),
+    # Keep a few motion events per drag segment, some apps ignore drags without them
+    "fast": InputProfile(move_duration=0.0, drag_duration=0.1, type_interval=0.0, pause=0.02),
+    # Glide and pause like a person would, the timing LocalComputer always used
+    "humanlike": InputProfile(move_duration=0.1, drag_duration=1.0, type_interval=0.0, pause=0.1),
+}
+
+
+def get_profile(profile: str | InputProfile) -> InputProfile:
+    if isinstance(profile, InputProfile):
+        return profile
+    if profile not in profiles:
+        raise ValueError(f"Unsupported input profile '{profile}'.")
+    return profiles[profile]
+
+
+class PyAutoGUIInput:
+    """Send input through pyautogui, which works on every platform."""
+
+    name = "pyautogui"
+
+    keymap = {
+        "arrowdown": "down",
+        "arrowleft": "left",
+        "arrowright": "right",
+        "arrowup": "up",
+    }
+
+    def __init__(self, profile: InputProfile):
+        import pyautogui
+        self.pyautogui = pyautogui
+        self.profile = profile
+
+    def click(self, x: int, y: int, button: str = "left"):
+        self.pyautogui.moveTo(x, y, duration=self.profile.move_duration, _pause=False)
+        self.pyautogui.click(x, y, button=button, _pause=False)
+
+    def double_click(self, x: int, y: int):
+        self.pyautogui.moveTo(x, y, duration=self.profile.move_duration, _pause=False)
+        self.pyautogui.doubleClick(x, y, _pause=False)
+
+    def scroll(self, x: int, y: int, scroll_x: int, scroll_y: int):
+        self.pyautogui.scroll(-scroll_y, x=x, y=y, _pause=False)
+        self.pyautogui.hscroll(scroll_x, x=x, y=y, _pause=False)
+
+    def type(self, text: str):
+        self.pyautogui.write(text, interval=self.profile.type_interval, _pause=False)
+
+    def move(self, x: int, y: int):
+        self.pyautogui.moveTo(x, y, duration=self.profile.move_duration, _pause=False)
+
+    def keypress(self, keys: list[str]):
+        keys = [self.keymap.get(key.lower(), key.lower()) for key in keys]
+        for key in keys:
+            self.pyautogui.keyDown(key, _pause=False)
+        for key in keys:
+            self.pyautogui.keyUp(key, _pause=False)
+
+    def drag(self, path: list[tuple[int, int]]):
+        duration = self.profile.drag_duration
+        self.pyautogui.moveTo(*path[0], duration=duration / 2, _pause=False)
+        self.pyautogui.mouseDown(button="left", _pause=False)
+        for point in path[1:]:
+            self.pyautogui.dragTo(*point, duration=duration, mouseDownUp=False, _pause=False)
+        self.pyautogui.mouseUp(button="left", _pause=False)
+
+    def close(self):
+        pass
+
+
+class XTestInput:
+    """Send input as XTEST fake events, one batch and one round trip per action.
+
+    Durations are handed to the X server as per-event delays, so glides and typing
+    intervals don't take extra round trips either.
+    """
+
+    name = "xtest"
+
+    buttons = {"left": 1, "middle": 2, "right": 3, "back": 8, "forward": 9}
+
+    keysyms = {
+        "ctrl": "Control_L", "control": "Control_L", "shift": "Shift_L",
+        "alt": "Alt_L", "option": "Alt_L",
+        "cmd": "Super_L", "command": "Super_L", "super": "Super_L", "win": "Super_L", "meta": "Super_L",
+        "enter": "Return", "return": "Return", "esc": "Escape", "escape": "Escape",
+        "tab": "Tab", "space": "space", "backspace": "BackSpace", "delete": "Delete", "del": "Delete",
+        "insert": "Insert", "home": "Home", "end": "End", "pageup": "Prior", "pagedown": "Next",
+        "up": "Up", "down": "Down", "left": "Left", "right": "Right",
+        "arrowup": "Up", "arrowdown": "Down", "arrowleft": "Left", "arrowright": "Right",
+        "capslock": "Caps_Lock", "printscreen": "Print",
+    }
+
+    # Motion events per second while gliding
+    motion_rate = 100
+
+    def __init__(self, profile: InputProfile, display: str | None = None):
+        from Xlib import X, XK
+        from Xlib.display import Display
+        from Xlib.ext import xtest
+        self.X = X
+        self.XK = XK
+        self.xtest = xtest
+        self.display = Display(display)
+        if not self.display.has_extension("XTEST"):
+            self.display.close()
+            raise RuntimeError("The X server has no XTEST extension.")
+        self.profile = profile
+        self.root = self.display.screen().root
+        self.scratch_keycode = None
+
+    def _fake(self, event_type, detail=0, delay: float = 0, x=0, y=0):
+        self.xtest.fake_input(self.display, event_type, detail, time=int(delay * 1000), x=x, y=y)
+
+    def _glide(self, start, end, duration: float):
+        """Queue motion events from start to end spread over duration."""
+        steps = max(1, int(duration * self.motion_rate))
+        delay = duration / steps
+        for step in range(1, steps + 1):
+            x = round(start[0] + (end[0] - start[0]) * step / steps)
+            y = round(start[1] + (end[1] - start[1]) * step / steps)
+            self._fake(self.X.MotionNotify, delay=delay, x=x, y=y)
+
+    def _move(self, x: int, y: int, duration: float):
+        start = (x, y)
+        if duration:
+            pointer = self.root.query_pointer()
+            start = (pointer.root_x, pointer.root_y)
+        self._glide(start, (x, y), duration)
+
+    def _button(self, button: int, count: int = 1):
+        for _ in range(count):
+            self._fake(self.X.ButtonPress, button)
+            self._fake(self.X.ButtonRelease, button)
+
+    def _char_keysym(self, char: str) -> int:
+        if char == "\n":
+            return self.XK.XK_Return
+        if char == "\t":
+            return self.XK.XK_Tab
+        code = ord(char)
+        if 0x20 <= code <= 0x7E or 0xA0 <= code <= 0xFF:
+            return code
+        # Unicode keysyms, see keysymdef.h
+        return 0x01000000 | code
+
+    def _key_keysym(self, key: str) -> int:
+        if len(key) == 1:
+            return self._char_keysym(key)
+        name = self.keysyms.get(key.lower())
+        if name is None and key.lower()[0] == "f" and key[1:].isdigit():
+            name = key.upper()
+        keysym = self.XK.string_to_keysym(name or key)
+        if keysym == self.X.NoSymbol:
+            raise ValueError(f"Unsupported key '{key}'.")
+        return keysym
+
+    def _keycode(self, keysym: int) -> tuple[int, bool]:
+        """Return the keycode for keysym and whether it needs shift, mapping it if needed."""
+        for keycode, index in self.display.keysym_to_keycodes(keysym):
+            if index in (0, 1):
+                return keycode, index == 1
+        # Not on the keyboard, bind it to a spare keycode for the moment
+        if self.scratch_keycode is None:
+            self.scratch_keycode = self._spare_keycode()
+        self.display.change_keyboard_mapping(self.scratch_keycode, [(keysym, keysym)])
+        self.display.sync()
+        return self.scratch_keycode, False
+
+    def _spare_keycode(self) -> int:
+        first = self.display.display.info.min_keycode
+        count = self.display.display.info.max_keycode - first + 1
+        mapping = self.display.get_keyboard_mapping(first, count)
+        for offset, keysyms in enumerate(mapping):
+            if not any(keysyms):
+                return first + offset
+        raise RuntimeError("No spare keycode to type characters that are not on the keyboard.")
+
+    def _release_scratch(self):
+        if self.scratch_keycode is not None:
+            self.display.sync()
+            self.display.change_keyboard_mapping(self.scratch_keycode, [(self.X.NoSymbol, self.X.NoSymbol)])
+
+    def click(self, x: int, y: int, button: str = "left"):
+        self._move(x, y, self.profile.move_duration)
+        self._button(self.buttons.get(button, 1))
+        self.display.sync()
+
+    def double_click(self, x: int, y: int):
+        self._move(x, y, self.profile.move_duration)
+        self._button(1, count=2)
+        self.display.sync()
+
+    def scroll(self, x: int, y: int, scroll_x: int, scroll_y: int):
+        self._move(x, y, 0)
+        if scroll_y:
+            self._button(5 if scroll_y > 0 else 4, abs(scroll_y))
+        if scroll_x:
+            self._button(7 if scroll_x > 0 else 6, abs(scroll_x))
+        self.display.sync()
+
+    def type(self, text: str):
+        shift = self.display.keysym_to_keycode(self.XK.XK_Shift_L)
+        for char in text:
+            keycode, shifted = self._keycode(self._char_keysym(char))
+            if shifted:
+                self._fake(self.X.KeyPress, shift, delay=self.profile.type_interval)
+            self._fake(self.X.KeyPress, keycode, delay=0 if shifted else self.profile.type_interval)
+            self._fake(self.X.KeyRelease, keycode)
+            if shifted:
+                self._fake(self.X.KeyRelease, shift)
+            if keycode == self.scratch_keycode:
+                # Send it before the next character changes the mapping again
+                self.display.sync()
+        self._release_scratch()
+        self.display.sync()
+
+    def move(self, x: int, y: int):
+        self._move(x, y, self.profile.move_duration)
+        self.display.sync()
+
+    def keypress(self, keys: list[str]):
+        keycodes = [self._keycode(self._key_keysym(key))[0] for key in keys]
+        for keycode in keycodes:
+            self._fake(self.X.KeyPress, keycode)
+        for keycode in reversed(keycodes):
+            self._fake(self.X.KeyRelease, keycode)
+        self._release_scratch()
+        self.display.sync()
+
+    def drag(self, path: list[tuple[int, int]]):
+        duration = self.profile.drag_duration
+        self._move(*path[0], duration / 2)
+        self._fake(self.X.ButtonPress, 1)
+        for start, end in zip(path, path[1:]):
+            self._glide(start, end, duration)
+        self._fake(self.X.ButtonRelease, 1)
+        self.display.sync()
+
+    def close(self):
+        self.display.close()
+
+
+backends = {"pyautogui": PyAutoGUIInput, "xtest": XTestInput}
+
+
+def create(backend: str = "auto", profile: str | InputProfile = "humanlike"):
+    """Create the named input backend, or with auto XTEST on Linux when the server has it."""
+    profile = get_profile(profile)
+    if backend != "auto":
+        if backend not in backends:
+            raise ValueError(f"Unsupported input backend '{backend}'.")
+        return backends[backend](profile)
+    if sys.platform.startswith("linux"):
+        try:
+            return XTestInput(profile)
+        except Exception:
+            # No python-xlib or no X server with XTEST, use pyautogui instead
+            pass
+    return PyAutoGUIInput(profile)
@@ -9,10 +9,14 @@ import asyncio
 import logging
 import os
 from dotenv import load_dotenv
+import backends
+import coalesce
 import cua
-import local_computer
+import settle
+import tracing
+import trajectory
 import openai
-import vm_computer
+import replay
 
 
 async def main():
@@ -31,38 +35,97 @@ async def main():
         help="The endpoint to use, either OpenAI or Azure OpenAI")
     parser.add_argument("--autoplay", dest="autoplay", action="store_true",
         default=True, help="Autoplay actions without confirmation")
-    parser.add_argument("--environment", dest="environment", default="linux_vm")
+    parser.add_argument("--environment", dest="environment", default="linux_vm",
+        choices=list(backends.registry), help="Computer to control")
+    parser.add_argument("--capture", dest="capture", default="auto",
+        choices=["auto", "mss", "pil", "pyautogui"], help="Screen capture backend of the local computer")
+    parser.add_argument("--input", dest="input", default="auto",
+        choices=["auto", "xtest", "pyautogui"], help="Input backend of the local computer")
+    parser.add_argument("--input-profile", dest="input_profile", default="humanlike",
+        choices=["instant", "fast", "humanlike"], help="Mouse and keyboard timing of the local computer")
+    parser.add_argument("--image-format", dest="image_format", default="png",
+        choices=["png", "jpeg", "webp"], help="Format of the screenshots sent to the model")
+    parser.add_argument("--image-quality", dest="image_quality", type=int, default=85,
+        help="Quality for jpeg and webp screenshots")
+    parser.add_argument("--stream", dest="stream", action="store_true",
+        help="Stream responses and show reasoning as soon as it arrives")
+    parser.add_argument("--trace", dest="trace",
+        help="Write timing spans for every step to this file")
+    parser.add_argument("--trace-format", dest="trace_format", default="jsonl",
+        choices=["jsonl", "otlp"], help="Format of the trace file")
+    parser.add_argument("--record", dest="record",
+        help="Record the trajectory with all frames into this folder")
+    parser.add_argument("--replay", dest="replay",
+        help="Answer requests seen before from the responses cached in this folder")
+    parser.add_argument("--replay-mode", dest="replay_mode", default="lenient",
+        choices=["lenient", "strict", "record"],
+        help="On a cache miss call the model (lenient) or fail (strict), or always call the model and record (record)")
+    parser.add_argument("--replay-max-entries", dest="replay_max_entries", type=int,
+        help="Evict the least recently used responses beyond this number")
+    parser.add_argument("--coalesce", dest="coalesce", action="store_true",
+        help="Merge redundant moves, scrolls and drag points before they reach the computer")
+    parser.add_argument("--settle", dest="settle", action="store_true",
+        help="Wait for the screen to stop changing after each action")
+    parser.add_argument("--settle-timeout", dest="settle_timeout", type=int, default=2000,
+        help="Maximum time in ms to wait for the screen to settle")
     args = parser.parse_args()
 
-    if args.endpoint == "azure":
-        client = openai.AsyncAzureOpenAI(
-            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
-            api_key=os.environ["AZURE_OPENAI_API_KEY"],
-            api_version="2025-03-01-preview",
+    # Computer is used to take screenshots and send keystrokes or mouse clicks
+    if args.environment == "linux_vm":
+        options = dict(
+            hostname=os.getenv("VM_HOSTNAME"),
+            username=os.getenv("VM_USERNAME"),
+            password=os.getenv("VM_PASSWORD"),
         )
+    elif args.environment == "vnc":
+        options = dict(
+            hostname=os.getenv("VNC_HOSTNAME", "127.0.0.1"),
+            port=int(os.getenv("VNC_PORT", "5900")),
+            password=os.getenv("VNC_PASSWORD"),
+        )
+    elif args.environment == "local":
+        options = dict(capture=args.capture, input_backend=args.input, input_profile=args.input_profile)
     else:
-        client = openai.AsyncOpenAI()
+        options = {}
+
+    # Scaler is used to resize the screen to a smaller size
+    def scale(computer):
+        if args.coalesce:
+            computer = coalesce.Coalescer(computer)
+        return cua.Scaler(computer, (1024, 768),
+            image_format=args.image_format, quality=args.image_quality)
+
+    def create_client():
+        if args.endpoint == "azure":
+            return openai.AsyncAzureOpenAI(
+                azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+                api_key=os.environ["AZURE_OPENAI_API_KEY"],
+                api_version="2025-03-01-preview",
+            )
+        return openai.AsyncOpenAI()
+
+    # Connect to the computer while the client is built on a thread, which leaves
+    # the event loop free to run the startup task
+    geometry = backends.GeometryCache()
+    startup = asyncio.create_task(backends.start(args.environment, scale, geometry, **options))
+    client = await asyncio.to_thread(create_client)
+    # Retries are handled by the agent's limiter so they share its pauses and backoff
+    client = client.with_options(max_retries=0)
+
+    if args.replay:
+        client = replay.ReplayClient(client, args.replay, mode=args.replay_mode,
+            max_entries=args.replay_max_entries)
 
     model = args.model
 
-    # Computer is used to take screenshots and send keystrokes or mouse clicks
-    computer = local_computer.LocalComputer()
+    detector = None
+    if args.settle:
+        detector = settle.SettleDetector(timeout_ms=args.settle_timeout)
 
-    # Scaler is used to resize the screen to a smaller size
-    computer = cua.Scaler(computer, (1024, 768))
-
-    #vm implementation    
-    vm = vm_computer.VMComputer(
-        hostname=os.getenv("VM_HOSTNAME"),
-        username=os.getenv("VM_USERNAME"),
-        password=os.getenv("VM_PASSWORD"),
-    )
-    vm = cua.Scaler(vm, (1024, 768))
-    
-    if args.environment == "linux_vm":
-        agent = cua.Agent(client, model, vm)
-    else:
-        agent = cua.Agent(client, model, computer)
+    recorder = trajectory.TrajectoryRecorder(args.record) if args.record else None
+
+    computer = await startup
+    agent = cua.Agent(client, model, computer, settle=detector, stream=args.stream, recorder=recorder)
     # Get the user request
     if args.instructions:
         user_input = args.instructions
@@ -71,26 +134,61 @@ async def main():
 
     logger.info(f"User: {user_input}")
     
+    tracer = tracing.Tracer(args.trace, format=args.trace_format)
+    tracing.activate(tracer)
+
     agent.start_task()
-    while True:
-        if not user_input and agent.requires_user_input:
-            logger.info("")
-            user_input = input("User: ")
-        await agent.continue_task(user_input)
-        user_input = None
-        if agent.requires_consent and not args.autoplay:
-            input("Press Enter to run computer tool...")
-        elif agent.pending_safety_checks and not args.autoplay:
-            logger.info(f"Safety checks: {agent.pending_safety_checks}")
-            input("Press Enter to acknowledge and continue...")
-        if agent.reasoning_summary:
-            logger.info("")
-            logger.info(f"Action: {agent.reasoning_summary}")
-        for action, action_args in agent.actions:
-            logger.info(f"  {action} {action_args}")
-        if agent.messages:
-            logger.info("")
-            logger.info(f"Agent: {"".join(agent.messages)}")
+    try:
+        while True:
+            if not user_input and agent.requires_user_input:
+                logger.info("")
+                user_input = input("User: ")
+            if args.stream:
+                async for item in agent.stream_task(user_input):
+                    if item.type == "reasoning" and item.summary:
+                        logger.info("")
+                        logger.info(f"Action: {''.join(summary.text for summary in item.summary)}")
+                    elif item.type == "computer_call":
+                        action, action_args = agent.call_action(item)
+                        logger.info(f"  {action} {action_args}")
+                    elif item.type == "message":
+                        text = "".join(content.text for content in item.content if content.type == "output_text")
+                        logger.info("")
+                        logger.info(f"Agent: {text}")
+            else:
+                await agent.continue_task(user_input)
+            user_input = None
+            if agent.requires_consent and not args.autoplay:
+                input("Press Enter to run computer tool...")
+            elif agent.pending_safety_checks and not args.autoplay:
+                logger.info(f"Safety checks: {agent.pending_safety_checks}")
+                input("Press Enter to acknowledge and continue...")
+            for report in agent.settle_reports:
+                logger.info(f"  settled in {report.elapsed_ms:.0f} ms ({report.frames} frames)")
+            if args.stream:
+                continue
+            if agent.reasoning_summary:
+                logger.info("")
+                logger.info(f"Action: {agent.reasoning_summary}")
+            for action, action_args in agent.actions:
+                logger.info(f"  {action} {action_args}")
+            if agent.messages:
+                logger.info("")
+                logger.info(f"Agent: {''.join(agent.messages)}")
+    finally:
+        logger.info("")
+        logger.info(tracer.summary())
+        tracer.close()
+        # Remember the screen size for the next run
+        if computer.screen_size:
+            geometry.put(backends.geometry_key(args.environment, options), computer.screen_size)
+            geometry.save()
+        if args.coalesce:
+            logger.info(computer.computer.summary())
+        if args.replay:
+            logger.info(f"Replay: {client.hits} hits, {client.misses} misses")
+        if recorder:
+            recorder.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,256 @@
+"""
+Run many CUA tasks concurrently over a pool of VMs.
+Tasks are read from a JSONL file with one {"id": ..., "instructions": ...} object per line
+and a result line is appended to the results file as soon as each task finishes.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+from dotenv import load_dotenv
+import coalesce
+import cua
+import openai
+import ratelimit
+import replay
+import tracing
+import trajectory
+import vm_computer
+
+
+class ComputerPool:
+    """Hands out computers to tasks so that each computer runs one task at a time."""
+
+    def __init__(self, computers):
+        self.size = len(computers)
+        self.queue = asyncio.Queue()
+        for computer in computers:
+            self.queue.put_nowait(computer)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        computer = await self.queue.get()
+        try:
+            yield computer
+        finally:
+            self.queue.put_nowait(computer)
+
+
+class Orchestrator:
+    """Schedule agents for a queue of tasks across a pool of computers."""
+
+    def __init__(self, client, model: str, pool: ComputerPool, concurrency: int | None = None,
+                 max_steps: int = 50, timeout: float = 600, logger=None, agent_options=None,
+                 record_dir: str | None = None):
+        self.client = client
+        self.model = model
+        self.pool = pool
+        self.semaphore = asyncio.Semaphore(concurrency or pool.size)
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.logger = logger
+        self.agent_options = agent_options or {}
+        self.record_dir = record_dir
+
+    async def _drive(self, agent, task, result):
+        max_steps = task.get("max_steps", self.max_steps)
+        user_message = task["instructions"]
+        agent.start_task()
+        while result["steps"] < max_steps:
+            await agent.continue_task(user_message)
+            user_message = None
+            result["steps"] += 1
+            result["messages"].extend(agent.messages)
+            if agent.requires_user_input:
+                result["status"] = "completed"
+                return
+        result["status"] = "max_steps"
+
+    async def run_task(self, task: dict) -> dict:
+        result = {"id": task["id"], "status": "pending", "steps": 0, "messages": []}
+        async with self.semaphore, self.pool.acquire() as computer:
+            start = time.monotonic()
+            recorder = None
+            if self.record_dir:
+                recorder = trajectory.TrajectoryRecorder(os.path.join(self.record_dir, str(task["id"])))
+            agent = cua.Agent(self.client, self.model, computer, logger=self.logger,
+                              recorder=recorder, **self.agent_options)
+            try:
+                timeout = task.get("timeout", self.timeout)
+                await asyncio.wait_for(self._drive(agent, task, result), timeout)
+            except asyncio.TimeoutError:
+                result["status"] = "timeout"
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = f"{type(e).__name__}: {e}"
+            finally:
+                if recorder:
+                    recorder.close()
+            result["elapsed"] = round(time.monotonic() - start, 3)
+        if self.logger:
+            self.logger.info(f"Task {result['id']}: {result['status']} after {result['steps']} steps")
+        return result
+
+    async def run(self, tasks: list[dict], results_path: str) -> list[dict]:
+        results = []
+        with open(results_path, "a", encoding="utf-8") as results_file:
+            for future in asyncio.as_completed([self.run_task(task) for task in tasks]):
+                result = await future
+                results_file.write(json.dumps(result) + "\n")
+                results_file.flush()
+                results.append(result)
+        return results
+
+
+def load_tasks(path: str) -> list[dict]:
+    tasks = []
+    with open(path, encoding="utf-8") as tasks_file:
+        for index, line in enumerate(tasks_file):
+            if not line.strip():
+                continue
+            task = json.loads(line)
+            if isinstance(task, str):
+                task = {"instructions": task}
+            task.setdefault("id", index)
+            tasks.append(task)
+    return tasks
+
+
+def load_computers(path: str | None, args, image_pool=None) -> list:
+    if path:
+        with open(path, encoding="utf-8") as computers_file:
+            hosts = json.load(computers_file)
+    else:
+        hosts = [{"hostname": os.getenv("VM_HOSTNAME")}]
+    computers = []
+    for host in hosts:
+        vm = vm_computer.VMComputer(
+            hostname=host["hostname"],
+            username=host.get("username", os.getenv("VM_USERNAME")),
+            password=host.get("password", os.getenv("VM_PASSWORD")),
+        )
+        computer = coalesce.Coalescer(vm) if args.coalesce else vm
+        computers.append(cua.Scaler(computer, (1024, 768),
+            image_format=args.image_format, quality=args.image_quality, pool=image_pool))
+    return computers
+
+
+async def prepare_computers(computers: list, logger) -> None:
+    """Connect to every computer at once and read its screen size.
+
+    Coordinates of actions are mapped with the screen size, so it has to be known
+    before a task's first action, which may come before any screenshot.
+    """
+    async def prepare(computer):
+        await computer.warm()
+        await computer.fetch_dimensions()
+
+    results = await asyncio.gather(*(prepare(computer) for computer in computers), return_exceptions=True)
+    for computer, result in zip(computers, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Could not prepare {computer.computer.hostname}: {result}")
+
+
+async def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", dest="tasks", required=True,
+        help="JSONL file with one task per line")
+    parser.add_argument("--results", dest="results", default="results.jsonl",
+        help="JSONL file the results are appended to")
+    parser.add_argument("--computers", dest="computers",
+        help="JSON list of VM hosts, defaults to the VM_* environment variables")
+    parser.add_argument("--concurrency", dest="concurrency", type=int,
+        help="Maximum number of tasks running at once (default: pool size)")
+    parser.add_argument("--max-steps", dest="max_steps", type=int, default=50)
+    parser.add_argument("--timeout", dest="timeout", type=float, default=600,
+        help="Per task timeout in seconds")
+    parser.add_argument("--model", dest="model",
+        default="tekaisandbox-computer-use-preview")
+    parser.add_argument("--endpoint", default="azure",
+        help="The endpoint to use, either OpenAI or Azure OpenAI")
+    parser.add_argument("--image-format", dest="image_format", default="png",
+        choices=["png", "jpeg", "webp"], help="Format of the screenshots sent to the model")
+    parser.add_argument("--image-quality", dest="image_quality", type=int, default=85,
+        help="Quality for jpeg and webp screenshots")
+    parser.add_argument("--image-workers", dest="image_workers", type=int,
+        help="Scale and encode screenshots on a pool with this many workers")
+    parser.add_argument("--image-pool", dest="image_pool", default="thread",
+        choices=["thread", "process"], help="Kind of the screenshot worker pool")
+    parser.add_argument("--coalesce", dest="coalesce", action="store_true",
+        help="Merge redundant moves, scrolls and drag points before they reach the VMs")
+    parser.add_argument("--rpm", dest="rpm", type=float,
+        help="Requests per minute shared by all agents")
+    parser.add_argument("--tpm", dest="tpm", type=float,
+        help="Tokens per minute shared by all agents")
+    parser.add_argument("--trace", dest="trace",
+        help="Write timing spans for every step to this file")
+    parser.add_argument("--trace-format", dest="trace_format", default="jsonl",
+        choices=["jsonl", "otlp"], help="Format of the trace file")
+    parser.add_argument("--replay", dest="replay",
+        help="Answer requests seen before from the responses cached in this folder")
+    parser.add_argument("--replay-mode", dest="replay_mode", default="lenient",
+        choices=["lenient", "strict", "record"],
+        help="On a cache miss call the model (lenient) or fail (strict), or always call the model and record (record)")
+    parser.add_argument("--replay-max-entries", dest="replay_max_entries", type=int,
+        help="Evict the least recently used responses beyond this number")
+    parser.add_argument("--record", dest="record",
+        help="Record each task's trajectory into a subfolder of this folder")
+    args = parser.parse_args()
+
+    if args.endpoint == "azure":
+        client = openai.AsyncAzureOpenAI(
+            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+            api_key=os.environ["AZURE_OPENAI_API_KEY"],
+            api_version="2025-03-01-preview",
+        )
+    else:
+        client = openai.AsyncOpenAI()
+    # Retries are handled by the shared limiter so agents back off together
+    client = client.with_options(max_retries=0)
+    if args.replay:
+        client = replay.ReplayClient(client, args.replay, mode=args.replay_mode,
+            max_entries=args.replay_max_entries)
+    limiter = ratelimit.RateLimiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+
+    image_pool = None
+    if args.image_workers:
+        image_pool = cua.ImagePool(args.image_workers, kind=args.image_pool)
+    computers = load_computers(args.computers, args, image_pool)
+    await prepare_computers(computers, logger)
+    pool = ComputerPool(computers)
+    orchestrator = Orchestrator(client, args.model, pool, concurrency=args.concurrency,
+        max_steps=args.max_steps, timeout=args.timeout, logger=logger,
+        agent_options={"rate_limiter": limiter}, record_dir=args.record)
+    tracer = tracing.Tracer(args.trace, format=args.trace_format)
+    tracing.activate(tracer)
+    tasks = load_tasks(args.tasks)
+    logger.info(f"Running {len(tasks)} tasks on {pool.size} computers")
+    try:
+        results = await orchestrator.run(tasks, args.results)
+    finally:
+        logger.info(tracer.summary())
+        tracer.close()
+        if image_pool:
+            logger.info(f"Screenshots waited {image_pool.mean_queue_ms:.1f} ms on average "
+                        f"(max {image_pool.max_queue_ms:.1f} ms) for an image worker")
+            image_pool.close()
+        if args.coalesce:
+            for computer in computers:
+                logger.info(f"{computer.computer.computer.hostname}: {computer.computer.summary()}")
+    completed = sum(result["status"] == "completed" for result in results)
+    logger.info(f"Completed {completed} of {len(results)} tasks")
+    if args.replay:
+        logger.info(f"Replay: {client.hits} hits, {client.misses} misses")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,155 @@
+import asyncio
+import random
+import re
+import time
+
+import openai
+
+# Errors that are worth retrying, everything else is raised to the caller
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class RetriesExhaustedError(RuntimeError):
+    """Raised when a request still fails after all retries."""
+
+    def __init__(self, message: str, last_error: Exception | None = None):
+        super().__init__(message)
+        self.last_error = last_error
+
+
+def parse_duration(value: str) -> float | None:
+    """Parse durations such as '20ms', '1.5s' or '6m0s' from rate limit headers."""
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+    if parts:
+        return sum(float(amount) * units[unit] for amount, unit in parts)
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount from the bucket and return how long to wait before using it."""
+        self._refill()
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def limit(self, remaining: float):
+        self._refill()
+        self.level = min(self.level, remaining)
+
+
+class RateLimiter:
+    """Client-side rate limits and retry policy shared by every Agent of a deployment.
+
+    Requests and tokens are limited with token buckets that are corrected from the
+    x-ratelimit-* response headers. When the server rejects a request all Agents
+    sharing the limiter pause together instead of each backing off on its own.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_retries: int = 8,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        estimated_tokens: int = 4000,
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.estimated_tokens = estimated_tokens
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> int:
+        """Wait until a request may be sent and return the number of tokens reserved for it."""
+        tokens = self.estimated_tokens
+        delay = self.paused_until - time.monotonic()
+        if self.requests:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return tokens
+
+    def release(self, reserved: int):
+        """Give back the tokens reserved for a request that used none."""
+        if self.tokens:
+            self.tokens.give_back(reserved)
+
+    def record_usage(self, reserved: int, used: int):
+        if self.tokens:
+            self.tokens.give_back(reserved - used)
+        # Track a moving average so the next reservation is closer to reality
+        self.estimated_tokens = int(0.8 * self.estimated_tokens + 0.2 * used)
+
+    def update(self, headers):
+        """Correct the buckets from the rate limit headers of a response."""
+        if not headers:
+            return
+        for name, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            remaining = headers.get(f"x-ratelimit-remaining-{name}")
+            reset = headers.get(f"x-ratelimit-reset-{name}")
+            if remaining is None:
+                continue
+            remaining = float(remaining)
+            if bucket:
+                bucket.limit(remaining)
+            needed = 1 if name == "requests" else self.estimated_tokens
+            if remaining < needed and reset:
+                self.pause(parse_duration(reset) or 0)
+
+    def retry_after(self, error: Exception) -> float | None:
+        response = getattr(error, "response", None)
+        headers = response.headers if response is not None else {}
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return parse_duration(headers["retry-after"])
+        match = re.search(r"Please try again in (\d+)s", str(getattr(error, "message", "")))
+        return int(match.group(1)) if match else None
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Return how long to wait before retrying after error."""
+        response = getattr(error, "response", None)
+        if response is not None:
+            self.update(response.headers)
+        # Exponential backoff with full jitter so sessions don't retry in lockstep
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after + random.uniform(0, self.base_delay))
+        if isinstance(error, openai.RateLimitError):
+            self.pause(delay)
+        return delay
@@ -0,0 +1,234 @@
+import collections
+import hashlib
+import inspect
+import json
+import os
+from types import SimpleNamespace
+
+import openai
+import pydantic
+
+MODES = ("lenient", "strict", "record")
+# Response ids remembered to chain request keys. Each session only needs its latest
+# one, so this only has to exceed the number of sessions sharing a client.
+MAX_RESPONSE_IDS = 1024
+
+
+class ReplayMissError(LookupError):
+    """Raised in strict mode when a request has no recorded response."""
+
+
+class ResponseCache:
+    """Least recently used store of responses, kept in a folder or in memory.
+
+    Each response is a JSON file named after its key. The modification time of the
+    file is the time it was last used, so the eviction order survives restarts.
+    """
+
+    def __init__(self, directory: str | None = None, max_entries: int | None = None,
+                 max_bytes: int | None = None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizes = collections.OrderedDict()
+        self.memory = {}
+        self.total_bytes = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            entries = []
+            for name in os.listdir(directory):
+                if name.endswith(".json"):
+                    stat = os.stat(os.path.join(directory, name))
+                    entries.append((stat.st_mtime, name[:-5], stat.st_size))
+            for _, key, size in sorted(entries):
+                self.sizes[key] = size
+                self.total_bytes += size
+            self._evict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.sizes
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def get(self, key: str) -> str | None:
+        if key not in self.sizes:
+            return None
+        self.sizes.move_to_end(key)
+        if not self.directory:
+            return self.memory[key]
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as entry:
+                data = entry.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Removed by another process sharing the folder
+            self.total_bytes -= self.sizes.pop(key)
+            return None
+        return data
+
+    def put(self, key: str, data: str):
+        if key in self.sizes:
+            self.total_bytes -= self.sizes.pop(key)
+        if self.directory:
+            # Write to a temporary file first so readers never see half an entry
+            temp_path = self._path(key) + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as entry:
+                entry.write(data)
+            os.replace(temp_path, self._path(key))
+        else:
+            self.memory[key] = data
+        self.sizes[key] = len(data.encode())
+        self.total_bytes += self.sizes[key]
+        self._evict()
+
+    def _evict(self):
+        while self.sizes and (
+            (self.max_entries is not None and len(self.sizes) > self.max_entries)
+            or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+        ):
+            key, size = self.sizes.popitem(last=False)
+            self.total_bytes -= size
+            if self.directory:
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            else:
+                del self.memory[key]
+
+
+class ReplayResponses:
+    """client.responses stand-in that serves recorded responses for known requests."""
+
+    def __init__(self, client, cache: ResponseCache, mode: str):
+        self.client = client
+        self.cache = cache
+        self.mode = mode
+        # Key of the request that produced each recent response, to chain the keys of a session
+        self.request_keys = collections.OrderedDict()
+        self.last_input = None
+        self.last_key = None
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, request: dict) -> str:
+        """Hash the parts of a request that decide the response.
+
+        Screenshots are reduced to a hash of their content, and call ids and
+        response ids are left out since they differ between runs. The previous
+        response is represented by the key of the request that produced it.
+        """
+        # The Agent asks whether a request is cached right before sending it
+        if request.get("input") is self.last_input and self.last_input is not None:
+            return self.last_key
+        items = []
+        for item in request.get("input") or []:
+            item_type = item.get("type")
+            if item_type == "computer_call_output":
+                image_url = item["output"].get("image_url", "")
+                digest = hashlib.blake2b(image_url.encode(), digest_size=16).hexdigest()
+                items.append(["screenshot", digest])
+            elif item_type == "function_call_output":
+                items.append(["tool_output", item["output"]])
+            elif "role" in item:
+                items.append(["message", item["role"], item["content"]])
+            else:
+                items.append({k: v for k, v in item.items() if k not in ("id", "call_id")})
+        previous_id = request.get("previous_response_id")
+        normalized = {
+            "model": request.get("model"),
+            "previous": self.request_keys.get(previous_id, previous_id),
+            "input": items,
+            "tools": request.get("tools"),
+            "reasoning": request.get("reasoning"),
+            "truncation": request.get("truncation"),
+        }
+        data = json.dumps(normalized, sort_keys=True, default=str)
+        self.last_input = request.get("input")
+        self.last_key = hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+        return self.last_key
+
+    def cached(self, request: dict) -> bool:
+        return self.mode != "record" and self.key(request) in self.cache
+
+    async def create(self, stream: bool = False, **request):
+        key = self.key(request)
+        data = None if self.mode == "record" else self.cache.get(key)
+        response = None
+        if data is not None:
+            try:
+                response = openai.types.responses.Response.model_validate_json(data)
+            except pydantic.ValidationError:
+                # Recorded with an incompatible SDK version, treat it as a miss
+                pass
+        if response is not None:
+            self.hits += 1
+            self._remember(response.id, key)
+            return self._stream(response) if stream else response
+        self.misses += 1
+        if self.mode == "strict":
+            raise ReplayMissError(f"No recorded response for request {key}.")
+        response = self.client.responses.create(stream=stream, **request)
+        if inspect.isawaitable(response):
+            response = await response
+        if stream:
+            return self._record_stream(key, response)
+        self._store(key, response)
+        return response
+
+    def _remember(self, response_id: str, key: str):
+        self.request_keys[response_id] = key
+        self.request_keys.move_to_end(response_id)
+        while len(self.request_keys) > MAX_RESPONSE_IDS:
+            self.request_keys.popitem(last=False)
+
+    def _store(self, key: str, response):
+        self._remember(response.id, key)
+        if response.status == "completed":
+            self.cache.put(key, response.model_dump_json())
+
+    async def _record_stream(self, key: str, events):
+        async for event in events:
+            if event.type == "response.completed":
+                self._store(key, event.response)
+            yield event
+
+    async def _stream(self, response):
+        yield SimpleNamespace(type="response.created", response=response)
+        for item in response.output:
+            yield SimpleNamespace(type="response.output_item.done", item=item)
+        yield SimpleNamespace(type="response.completed", response=response)
+
+
+class ReplayClient:
+    """Wrap a client so that requests seen before are answered from a cache.
+
+    In lenient mode a miss goes to the live model and its response is recorded,
+    in strict mode a miss raises ReplayMissError, and in record mode every request
+    goes to the live model and replaces the recorded response.
+    """
+
+    def __init__(self, client, directory: str | None = None, mode: str = "lenient",
+                 max_entries: int | None = None, max_bytes: int | None = None):
+        if mode not in MODES:
+            raise ValueError(f"Unsupported replay mode '{mode}'.")
+        self.client = client
+        self.cache = ResponseCache(directory, max_entries, max_bytes)
+        self.responses = ReplayResponses(client, self.cache, mode)
+
+    def cached(self, request: dict) -> bool:
+        """Return whether request will be answered without calling the model."""
+        return self.responses.cached(request)
+
+    @property
+    def hits(self) -> int:
+        return self.responses.hits
+
+    @property
+    def misses(self) -> int:
+        return self.responses.misses
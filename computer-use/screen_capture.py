@@ -0,0 +1,96 @@
+import sys
+
+import PIL.Image
+import PIL.ImageGrab
+import PIL.features
+
+
+class ScreenCapture:
+    """Grab raw RGB frames of the screen or of a region of it."""
+
+    name = None
+
+    def size(self) -> tuple[int, int]:
+        """Return the screen size without grabbing any pixels."""
+        import pyautogui
+        width, height = pyautogui.size()
+        return width, height
+
+    def grab(self, region: tuple[int, int, int, int] | None = None) -> PIL.Image.Image:
+        """Grab the screen, or the (left, top, width, height) region of it."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MSSCapture(ScreenCapture):
+    """Grab frames with mss, which reads the framebuffer directly without encoding."""
+
+    name = "mss"
+
+    def __init__(self):
+        import mss
+        self.sct = mss.mss()
+        # Monitor 1 is the primary monitor, the one pyautogui sends input to
+        self.monitor = self.sct.monitors[1]
+
+    def size(self) -> tuple[int, int]:
+        return self.monitor["width"], self.monitor["height"]
+
+    def grab(self, region=None) -> PIL.Image.Image:
+        monitor = self.monitor
+        if region:
+            left, top, width, height = region
+            monitor = {"left": monitor["left"] + left, "top": monitor["top"] + top, "width": width, "height": height}
+        shot = self.sct.grab(monitor)
+        # Frames come as BGRA, read them as RGB without an extra copy into a new buffer
+        return PIL.Image.frombuffer("RGB", shot.size, shot.bgra, "raw", "BGRX", 0, 1)
+
+    def close(self):
+        self.sct.close()
+
+
+class PILCapture(ScreenCapture):
+    """Grab frames with PIL.ImageGrab, through XCB on Linux."""
+
+    name = "pil"
+
+    def __init__(self):
+        if sys.platform.startswith("linux") and not PIL.features.check("xcb"):
+            raise RuntimeError("Pillow was built without XCB support.")
+
+    def grab(self, region=None) -> PIL.Image.Image:
+        bbox = None
+        if region:
+            left, top, width, height = region
+            bbox = (left, top, left + width, top + height)
+        return PIL.ImageGrab.grab(bbox=bbox).convert("RGB")
+
+
+class PyAutoGUICapture(ScreenCapture):
+    """Grab frames with pyautogui, which works everywhere pyautogui does."""
+
+    name = "pyautogui"
+
+    def grab(self, region=None) -> PIL.Image.Image:
+        import pyautogui
+        return pyautogui.screenshot(region=region).convert("RGB")
+
+
+backends = {"mss": MSSCapture, "pil": PILCapture, "pyautogui": PyAutoGUICapture}
+
+
+def create(backend: str = "auto") -> ScreenCapture:
+    """Create the named capture backend, or with auto the fastest one that works here."""
+    if backend != "auto":
+        if backend not in backends:
+            raise ValueError(f"Unsupported capture backend '{backend}'.")
+        return backends[backend]()
+    for name in ("mss", "pil"):
+        try:
+            return backends[name]()
+        except Exception:
+            # Not installed or no display support, try the next one
+            continue
+    return PyAutoGUICapture()
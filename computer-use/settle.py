@@ -0,0 +1,108 @@
+import asyncio
+import base64
+import hashlib
+import io
+import time
+from typing import NamedTuple
+
+import PIL.Image
+
+from frame import Frame
+
+
+class SettleReport(NamedTuple):
+    """Outcome of waiting for the screen to settle."""
+
+    elapsed_ms: float
+    frames: int
+    settled: bool
+
+
+class SettleDetector:
+    """Poll the screen after an action until consecutive frames stop changing.
+
+    With a tolerance of 0 frames are compared by content hash. A positive tolerance
+    compares small grayscale thumbnails instead and accepts a mean per-pixel
+    difference up to the tolerance (0-255), which ignores blinking cursors.
+    """
+
+    def __init__(
+        self,
+        interval_ms: int = 50,
+        stable_frames: int = 3,
+        timeout_ms: int = 2000,
+        tolerance: float = 0.0,
+        probe_size: tuple[int, int] = (64, 48),
+    ):
+        if stable_frames < 2:
+            raise ValueError("stable_frames must be at least 2.")
+        self.interval_ms = interval_ms
+        self.stable_frames = stable_frames
+        self.timeout_ms = timeout_ms
+        self.tolerance = tolerance
+        self.probe_size = probe_size
+
+    def _fingerprint(self, frame) -> bytes:
+        if isinstance(frame, PIL.Image.Image):
+            if not self.tolerance:
+                return hashlib.blake2b(frame.tobytes(), digest_size=16).digest()
+            image = frame.resize(self.probe_size, PIL.Image.Resampling.BOX)
+            return image.convert("L").tobytes()
+        data = frame.data if isinstance(frame, Frame) else base64.b64decode(frame)
+        if not self.tolerance:
+            return hashlib.blake2b(data, digest_size=16).digest()
+        image = PIL.Image.open(io.BytesIO(data))
+        image.draft("L", self.probe_size)
+        image = image.convert("L").resize(self.probe_size, PIL.Image.Resampling.BOX)
+        return image.tobytes()
+
+    def _matches(self, a: bytes, b: bytes) -> bool:
+        if not self.tolerance:
+            return a == b
+        diff = sum(abs(x - y) for x, y in zip(a, b)) / len(a)
+        return diff <= self.tolerance
+
+    async def wait(self, computer, timeout_ms: int | None = None) -> SettleReport:
+        timeout_ms = self.timeout_ms if timeout_ms is None else timeout_ms
+        start = time.perf_counter()
+        deadline = start + timeout_ms / 1000
+        previous = None
+        stable = 0
+        frames = 0
+        if not self.tolerance and hasattr(computer, "wait_for_change"):
+            return await self._wait_quiet(computer, start, deadline)
+        # Computers that hand out raw frames are probed without encoding them
+        capture = getattr(computer, "grab", None) or computer.screenshot
+        while True:
+            fingerprint = self._fingerprint(await capture())
+            frames += 1
+            if previous is not None and self._matches(fingerprint, previous):
+                stable += 1
+            else:
+                stable = 1
+            previous = fingerprint
+            now = time.perf_counter()
+            if stable >= self.stable_frames or now >= deadline:
+                elapsed_ms = (now - start) * 1000
+                return SettleReport(elapsed_ms, frames, stable >= self.stable_frames)
+            await asyncio.sleep(min(self.interval_ms / 1000, deadline - now))
+
+    async def _wait_quiet(self, computer, start: float, deadline: float) -> SettleReport:
+        """Wait on the change notifications of the computer instead of polling frames.
+
+        The screen counts as settled once it hasn't changed for as long as the
+        stable frames would take to poll.
+        """
+        quiet = self.interval_ms * (self.stable_frames - 1) / 1000
+        version = await computer.wait_for_change(timeout=0)
+        frames = 1
+        while True:
+            timeout = max(0.0, min(quiet, deadline - time.perf_counter()))
+            latest = await computer.wait_for_change(version, timeout=timeout)
+            now = time.perf_counter()
+            if latest == version and timeout >= quiet:
+                return SettleReport((now - start) * 1000, frames, True)
+            if now >= deadline:
+                return SettleReport((now - start) * 1000, frames, False)
+            version = latest
+            frames += 1
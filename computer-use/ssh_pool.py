@@ -0,0 +1,177 @@
+import asyncio
+import socket
+import paramiko
+
+
+class AsyncChannel:
+    """Non-blocking paramiko channel driven by the event loop instead of a thread per read."""
+
+    def __init__(self, channel: paramiko.Channel):
+        self.channel = channel
+        self.channel.setblocking(False)
+        self.buffer = bytearray()
+        self.eof = False
+        self.readable = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        # paramiko signals a pipe whenever data arrives, which the loop can watch
+        self.fd = channel.fileno()
+        self.loop.add_reader(self.fd, self._on_readable)
+
+    def _on_readable(self):
+        # The pipe also signals stderr, left unread it would keep the loop spinning
+        while self.channel.recv_stderr_ready():
+            self.channel.recv_stderr(65536)
+        try:
+            while True:
+                data = self.channel.recv(65536)
+                if not data:
+                    self.eof = True
+                    self.loop.remove_reader(self.fd)
+                    break
+                self.buffer += data
+        except socket.timeout:
+            pass
+        self.readable.set()
+
+    @property
+    def closed(self) -> bool:
+        return self.eof or self.channel.closed
+
+    async def _fill(self):
+        if self.eof:
+            raise ConnectionError("SSH channel closed.")
+        self.readable.clear()
+        await self.readable.wait()
+
+    async def read_exactly(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            await self._fill()
+        # Copy straight out of the buffer, slicing the bytearray first would copy twice
+        with memoryview(self.buffer) as view:
+            data = view[:size].tobytes()
+        del self.buffer[:size]
+        return data
+
+    async def readline(self) -> bytes:
+        while (end := self.buffer.find(b"\n")) < 0:
+            await self._fill()
+        line = bytes(self.buffer[:end + 1])
+        del self.buffer[:end + 1]
+        return line
+
+    async def write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            if self.channel.closed:
+                raise ConnectionError("SSH channel closed.")
+            try:
+                sent = self.channel.send(view)
+                view = view[sent:]
+            except socket.timeout:
+                # The remote window is full, give it a moment to drain
+                await asyncio.sleep(0.005)
+
+    def close(self) -> None:
+        if not self.eof:
+            self.eof = True
+            self.loop.remove_reader(self.fd)
+        self.channel.close()
+
+
+class SSHConnection:
+    """One SSH connection to a host, multiplexing channels and reconnecting when it drops."""
+
+    def __init__(self, hostname, port, username, password, keepalive: int = 15):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.client = None
+        # Bumped on every reconnect so users know their channels are stale
+        self.generation = 0
+        self.lock = asyncio.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        transport = self.client.get_transport() if self.client else None
+        return transport is not None and transport.is_active()
+
+    async def connect(self) -> None:
+        if self.healthy:
+            return
+        async with self.lock:
+            if self.healthy:
+                return
+            self.close()
+
+            def sync_connect():
+                client = paramiko.SSHClient()
+                client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                client.connect(
+                    self.hostname,
+                    port=self.port,
+                    username=self.username,
+                    password=self.password,
+                )
+                client.get_transport().set_keepalive(self.keepalive)
+                return client
+
+            self.client = await asyncio.to_thread(sync_connect)
+            self.generation += 1
+
+    async def check(self) -> bool:
+        """Probe the connection and reconnect if the transport has gone away."""
+        if self.healthy:
+            try:
+                self.client.get_transport().send_ignore()
+            except (OSError, EOFError, paramiko.SSHException):
+                self.close()
+        await self.connect()
+        return self.healthy
+
+    async def open_channel(self, command: str) -> AsyncChannel:
+        """Start a long-lived remote command and return its channel."""
+        await self.connect()
+
+        def sync_open():
+            channel = self.client.get_transport().open_session()
+            channel.exec_command(command)
+            return channel
+
+        return AsyncChannel(await asyncio.to_thread(sync_open))
+
+    async def exec(self, command: str) -> None:
+        await self.connect()
+        await asyncio.to_thread(self.client.exec_command, command)
+
+    async def open_sftp(self) -> paramiko.SFTPClient:
+        await self.connect()
+        return await asyncio.to_thread(self.client.open_sftp)
+
+    def close(self) -> None:
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+
+class SSHPool:
+    """Share one multiplexed connection per host between every computer that targets it."""
+
+    def __init__(self, keepalive: int = 15):
+        self.keepalive = keepalive
+        self.connections = {}
+
+    def get(self, hostname, port, username, password) -> SSHConnection:
+        key = (hostname, port, username)
+        if key not in self.connections:
+            self.connections[key] = SSHConnection(hostname, port, username, password, self.keepalive)
+        return self.connections[key]
+
+    def close(self) -> None:
+        for connection in self.connections.values():
+            connection.close()
+        self.connections.clear()
+
+
+default_pool = SSHPool()
@@ -0,0 +1,167 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+_tracer = contextvars.ContextVar("tracer", default=None)
+_parent = contextvars.ContextVar("parent_span", default=None)
+
+
+class Span:
+    """A timed phase of a step with attributes such as payload sizes or token usage."""
+
+    def __init__(self, name: str, attributes: dict, parent=None):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self, trace_id: str) -> dict:
+        def value(v):
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        start_ns = int(self.start_time * 1e9)
+        return {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(self.duration_ms * 1e6)),
+            "attributes": [{"key": k, "value": value(v)} for k, v in self.attributes.items()],
+        }
+
+
+class _NoSpan:
+    """Stand-in yielded by span() when no tracer is active."""
+
+    def set(self, **attributes):
+        pass
+
+
+_no_span = _NoSpan()
+
+
+class Tracer:
+    """Collect spans for every phase of a run and export them as JSONL or OTLP JSON.
+
+    Spans are written to the file as they finish. Only durations are kept in memory,
+    for the summary at the end of the run.
+    """
+
+    def __init__(self, path: str | None = None, format: str = "jsonl", service_name: str = "cua"):
+        if format not in ("jsonl", "otlp"):
+            raise ValueError(f"Unsupported trace format '{format}'.")
+        self.format = format
+        self.service_name = service_name
+        self.trace_id = os.urandom(16).hex()
+        self.file = open(path, "a", encoding="utf-8") if path else None
+        self.durations = {}
+        self.lock = threading.Lock()
+
+    def record(self, span: Span):
+        with self.lock:
+            self.durations.setdefault(span.name, []).append(span.duration_ms)
+            if self.file is None:
+                return
+            if self.format == "otlp":
+                # One ExportTraceServiceRequest per line, as written by the OTLP file exporter
+                record = {"resourceSpans": [{
+                    "resource": {"attributes": [
+                        {"key": "service.name", "value": {"stringValue": self.service_name}},
+                    ]},
+                    "scopeSpans": [{"scope": {"name": "cua"}, "spans": [span.to_otlp(self.trace_id)]}],
+                }]}
+            else:
+                record = span.to_dict()
+            self.file.write(json.dumps(record) + "\n")
+
+    def summary(self) -> str:
+        """Return a table with the count, p50, p95 and total time of every phase."""
+        def percentile(values, p):
+            index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+            return values[index]
+
+        lines = [f"{'phase':<24} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'total s':>10}"]
+        for name in sorted(self.durations):
+            values = sorted(self.durations[name])
+            p50 = percentile(values, 50)
+            p95 = percentile(values, 95)
+            total = sum(values) / 1000
+            lines.append(f"{name:<24} {len(values):>6} {p50:>10.1f} {p95:>10.1f} {total:>10.2f}")
+        return "\n".join(lines)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def activate(tracer: Tracer | None):
+    """Make tracer the destination of spans in the current context and tasks started from it."""
+    _tracer.set(tracer)
+
+
+def enabled() -> bool:
+    return _tracer.get() is not None
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """Time the enclosed block. Does nothing when no tracer is active."""
+    tracer = _tracer.get()
+    if tracer is None:
+        yield _no_span
+        return
+    current = Span(name, attributes, _parent.get())
+    token = _parent.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _parent.reset(token)
+        tracer.record(current)
+
+
+def add(name: str, start: float, end: float | None = None, **attributes):
+    """Record a span from start to end (time.perf_counter values), or to now without end."""
+    tracer = _tracer.get()
+    if tracer is None:
+        return
+    current = Span(name, attributes, _parent.get())
+    current.start_time -= time.perf_counter() - start
+    current.start = start
+    current.end = time.perf_counter() if end is None else end
+    tracer.record(current)
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+from frame import to_frame
+
+# Index record: frame digest, offset and length in the pack file, and image format
+INDEX_RECORD = struct.Struct(">16sQI8s")
+
+
+class FrameStore:
+    """Content-addressed frame store backed by one append-only pack file and an index.
+
+    Frames are keyed by a hash of their bytes, so a frame that was stored before,
+    such as an unchanged screen, costs nothing but the hash.
+    """
+
+    def __init__(self, directory: str, writable: bool = True):
+        self.pack_path = os.path.join(directory, "frames.pack")
+        self.index_path = os.path.join(directory, "frames.idx")
+        self.writable = writable
+        self.entries = {}
+        self.map = None
+        if writable:
+            os.makedirs(directory, exist_ok=True)
+            self.pack = open(self.pack_path, "ab")
+            self.index = open(self.index_path, "ab")
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as index:
+            data = index.read()
+        usable = len(data) - len(data) % INDEX_RECORD.size
+        for digest, offset, length, image_format in INDEX_RECORD.iter_unpack(data[:usable]):
+            self.entries[digest.hex()] = (offset, length, image_format.rstrip(b"\0").decode())
+
+    def put(self, data: bytes | memoryview, image_format: str = "png") -> str:
+        """Store a frame unless it is already present and return its digest."""
+        key = hashlib.blake2b(data, digest_size=16).digest()
+        digest = key.hex()
+        if digest in self.entries:
+            return digest
+        offset = self.pack.seek(0, os.SEEK_END)
+        self.pack.write(data)
+        self.pack.flush()
+        self.index.write(INDEX_RECORD.pack(key, offset, len(data), image_format.encode()))
+        self.index.flush()
+        self.entries[digest] = (offset, len(data), image_format)
+        return digest
+
+    def get(self, digest: str) -> memoryview:
+        """Return the bytes of a frame as a view into the memory-mapped pack file."""
+        offset, length, _ = self.entries[digest]
+        if self.map is None or offset + length > len(self.map):
+            # Map again to cover frames appended since the last mapping. The old map
+            # is left to the garbage collector since callers may still hold views.
+            with open(self.pack_path, "rb") as pack:
+                self.map = mmap.mmap(pack.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self.map)[offset:offset + length]
+
+    def format(self, digest: str) -> str:
+        return self.entries[digest][2]
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self.entries
+
+    def close(self):
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                # A frame view is still in use, the map closes when it is released
+                pass
+            self.map = None
+        if self.writable:
+            self.pack.close()
+            self.index.close()
+
+
+class TrajectoryRecorder:
+    """Append every agent step to a trajectory log, with frames kept in a FrameStore."""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.frames = FrameStore(directory)
+        self.log = open(os.path.join(directory, "trajectory.jsonl"), "a", encoding="utf-8")
+        self.last_screenshot = None
+        self.last_digest = None
+
+    def add_frame(self, screenshot, mime_type: str = "image/png") -> str:
+        # Backends hand back the very same object for an unchanged screen, skip the hash then
+        if screenshot is not self.last_screenshot:
+            frame = to_frame(screenshot, mime_type.split("/")[-1])
+            self.last_digest = self.frames.put(frame.data, frame.format)
+            self.last_screenshot = screenshot
+        return self.last_digest
+
+    def record_step(self, step: dict):
+        self.log.write(json.dumps(step, default=str) + "\n")
+        self.log.flush()
+
+    def close(self):
+        self.log.close()
+        self.frames.close()
+
+
+class TrajectoryReader:
+    """Iterate a recorded trajectory lazily and load frames only when asked for."""
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, "trajectory.jsonl")
+        self.frames = FrameStore(directory, writable=False)
+
+    def steps(self):
+        with open(self.path, encoding="utf-8") as log:
+            for line in log:
+                if line.strip():
+                    yield json.loads(line)
+
+    def __iter__(self):
+        return self.steps()
+
+    def frame(self, digest: str) -> memoryview:
+        return self.frames.get(digest)
+
+    def close(self):
+        self.frames.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
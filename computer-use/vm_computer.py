@@ -1,74 +1,254 @@
 import asyncio
 import base64
+import contextlib
 import io
+import shlex
+import struct
 import paramiko
 from PIL import Image
 from basecomputer import BaseComputer
+from frame import Frame
+import ssh_pool
+import tracing
 import time
 
+# Runs inside the VM for the lifetime of the SSH session. Each "capture" line on
+# stdin is answered with a header of a big-endian uint32 length and the uint16
+# width and height of the screen, followed by the frame on stdout. A zero length
+# frame means the capture failed. "capture WIDTH HEIGHT FORMAT LEVEL" asks for the
+# frame scaled to fit WIDTHxHEIGHT like Scaler does and encoded as FORMAT with
+# LEVEL as the quality, or compress level for PNG. Without Pillow in the VM the
+# frame is always the full size PNG.
+CAPTURE_HELPER = r"""
+import io, os, struct, subprocess, sys
+out = sys.stdout.buffer
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+try:
+    from PIL import ImageGrab
+    ImageGrab.grab(xdisplay=os.environ["DISPLAY"])
+except Exception:
+    ImageGrab = None
+def grab():
+    if ImageGrab is not None:
+        return ImageGrab.grab(xdisplay=os.environ["DISPLAY"])
+    cmd = ["import", "-silent", "-window", "root", "png:-"]
+    png = subprocess.run(cmd, capture_output=True, check=True).stdout
+    return Image.open(io.BytesIO(png)) if Image is not None else png
+def fit(image, width, height):
+    ratio = min(width / image.width, height / image.height)
+    size = (int(image.width * ratio), int(image.height * ratio))
+    if size != image.size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    if size != (width, height):
+        canvas = Image.new("RGB", (width, height), (0, 0, 0))
+        canvas.paste(image, (0, 0))
+        image = canvas
+    return image
+out.write(b"CUA2\n")
+out.flush()
+for line in sys.stdin:
+    args = line.split()
+    if not args or args[0] != "capture":
+        break
+    try:
+        shot = grab()
+        if isinstance(shot, bytes):
+            data = shot
+            width, height = struct.unpack(">II", shot[16:24])
+        else:
+            width, height = shot.size
+            image_format, options = "PNG", {"compress_level": 1}
+            if len(args) == 5:
+                shot = fit(shot, int(args[1]), int(args[2]))
+                image_format = args[3]
+                key = "compress_level" if image_format == "PNG" else "quality"
+                options = {key: int(args[4])}
+            if image_format == "JPEG" and shot.mode != "RGB":
+                shot = shot.convert("RGB")
+            buf = io.BytesIO()
+            shot.save(buf, image_format, **options)
+            data = buf.getvalue()
+    except Exception:
+        data, width, height = b"", 0, 0
+    out.write(struct.pack(">IHH", len(data), width, height))
+    out.write(data)
+    out.flush()
+"""
+
+
+def sniff_format(data: bytes) -> str:
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:2] == b"\xff\xd8":
+        return "jpeg"
+    return "png"
+
 
 class VMComputer(BaseComputer):
     """Use paramiko to take screenshots and perform actions on a remote VM."""
 
-    def __init__(self, hostname, username, password):
+    def __init__(self, hostname, username, password, capture_mode="daemon", port=22, pool=None,
+                 type_delay_ms=5, paste_threshold=50, paste_keys="ctrl+v", input_timeout=30):
         self.size = None
         self.hostname = hostname
         self.username = username
         self.password = password
-        self.client = None
+        self.port = port
+        # Computers on the same host share one multiplexed SSH connection
+        self.connection = (pool or ssh_pool.default_pool).get(hostname, port, username, password)
+        self.generation = 0
         self.sftp = None
-        self.port = 22
+        # "daemon" streams frames from a helper process kept alive in the VM and
+        # falls back to "gnome-screenshot" if the helper cannot be started.
+        self.capture_mode = capture_mode
+        self.capture_channel = None
+        # Whether the helper ever started, until then a failure means it can't run in this VM
+        self.capture_worked = False
+        self.capture_lock = asyncio.Lock()
+        # Input commands are queued and sent through one long-lived shell
+        self.input_channel = None
+        self.input_lock = asyncio.Lock()
+        self.input_queue = []
+        # Frames are scaled and encoded in the VM when a Scaler sets a target with set_target
+        self.target = None
+        self.input_seq = 0
+        self.batch_depth = 0
+        # Seconds to wait for the shell to acknowledge queued commands, plus the time
+        # queued typing is expected to take
+        self.input_timeout = input_timeout
+        self.input_queue_time = 0.0
+        # Text is typed key by key with this delay, or pasted through the clipboard
+        # when it is at least paste_threshold characters long (None never pastes)
+        self.type_delay_ms = type_delay_ms
+        self.paste_threshold = paste_threshold
+        self.paste_keys = paste_keys
 
     async def _connect(self):
-        if self.client is None or self.sftp is None:
-
-            def sync_connect():
-                self.client = paramiko.SSHClient()
-                self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                self.client.connect(
-                    self.hostname,
-                    port=self.port,
-                    username=self.username,
-                    password=self.password,
-                )
-                self.sftp = self.client.open_sftp()
+        await self.connection.connect()
+        if self.generation != self.connection.generation:
+            # The connection was (re)established, channels from before are gone
+            self.generation = self.connection.generation
+            self._stop_capture()
+            self._stop_input()
+            self.sftp = None
 
-            await asyncio.to_thread(sync_connect)
+    def _env_prefix(self) -> str:
+        display = ":0"
+        xauth = f"/home/{self.username}/.Xauthority"
+        return f"DISPLAY={display} XAUTHORITY={xauth}"
+
+    async def _reconnect(self):
+        await self.connection.check()
+        await self._connect()
+
+    async def warm(self):
+        await self._connect()
+        async with self.input_lock:
+            await self._start_input()
+        async with self.capture_lock:
+            if self.capture_mode == "daemon":
+                try:
+                    await self._start_capture()
+                except ConnectionError:
+                    # Screenshots fall back to gnome-screenshot when they run
+                    pass
+
+    async def close(self):
+        self._stop_capture()
+        self._stop_input()
 
     @property
     def environment(self):
         return "linux"
 
     @property
-    async def dimensions(self):
+    def dimensions(self):
+        # Only known after fetch_dimensions, reading it takes a round trip to the VM
+        return self.size
+
+    async def fetch_dimensions(self) -> tuple[int, int]:
         if not self.size:
-            # Take a screenshot from the VM
             await self._connect()
-            screenshot_path = "/tmp/vm_screenshot.png"
-            # Take screenshot using ImageMagick's import#
-            display = ":0"
-            xauth = f"/home/{self.username}/.Xauthority"
-            cmd = f"DISPLAY={display} XAUTHORITY={xauth} gnome-screenshot -f {screenshot_path}"
-            await asyncio.to_thread(self.client.exec_command, cmd)
-            await asyncio.sleep(1)
-            with io.BytesIO() as buf:
-                await asyncio.to_thread(self.sftp.getfo, screenshot_path, buf)
-                buf.seek(0)
-                img = Image.open(buf)
-                self.size = img.size
-            await asyncio.to_thread(self.sftp.remove, screenshot_path)
+            try:
+                command = f"{self._env_prefix()} xdotool getdisplaygeometry"
+                channel = await self.connection.open_channel(command)
+                try:
+                    line = await channel.readline()
+                finally:
+                    channel.close()
+                width, height = line.split()
+                self.size = (int(width), int(height))
+            except (ConnectionError, OSError, paramiko.SSHException, ValueError):
+                # Read the size from a screenshot instead
+                frame = await self._grab()
+                if not frame.source_size:
+                    with io.BytesIO(frame.data) as buf:
+                        self.size = Image.open(buf).size
         return self.size
 
-    async def screenshot(self) -> str:
-        await self._connect()
+    async def _start_capture(self):
+        if self.capture_channel is not None:
+            return
+        helper = shlex.quote(CAPTURE_HELPER)
+        # stderr is dropped, unread it would fill the SSH window
+        channel = await self.connection.open_channel(f"{self._env_prefix()} python3 -u -c {helper} 2>/dev/null")
+        try:
+            ready = await channel.read_exactly(5)
+        except ConnectionError:
+            ready = None
+        if ready != b"CUA2\n":
+            channel.close()
+            raise ConnectionError("Capture helper failed to start.")
+        self.capture_channel = channel
+        self.capture_worked = True
+
+    def _stop_capture(self):
+        if self.capture_channel is not None:
+            self.capture_channel.close()
+        self.capture_channel = None
+
+    def set_target(self, dimensions: tuple[int, int] | None, image_format: str = "png", level: int = 6):
+        """Have frames scaled to fit dimensions and encoded in the VM before they are sent.
+
+        level is the quality for jpeg and webp and the compress level for png.
+        """
+        if dimensions is None:
+            self.target = None
+        else:
+            width, height = dimensions
+            self.target = f"{width} {height} {image_format.upper()} {level}"
+
+    async def _capture_frame(self) -> Frame | None:
+        await self._start_capture()
+        request = f"capture {self.target}\n" if self.target else "capture\n"
+        try:
+            with tracing.span("vm.grab", scaled=self.target is not None):
+                await self.capture_channel.write(request.encode())
+                header = await self.capture_channel.read_exactly(8)
+                length, width, height = struct.unpack(">IHH", header)
+            if length == 0:
+                # The helper is alive but could not grab the display
+                return None
+            with tracing.span("vm.transfer", bytes=length):
+                data = await self.capture_channel.read_exactly(length)
+        except BaseException:
+            # A reply cut off by an error or a cancel would be read as the next one, start over
+            self._stop_capture()
+            raise
+        return Frame(data, sniff_format(data), source_size=(width, height))
+
+    async def _gnome_screenshot(self) -> bytes:
         screenshot_path = "/tmp/vm_screenshot.png"
         # Take screenshot using ImageMagick's import#
-        display = ":0"
-        xauth = f"/home/{self.username}/.Xauthority"
-        cmd = f"DISPLAY={display} XAUTHORITY={xauth} gnome-screenshot -f {screenshot_path}"
-        await asyncio.to_thread(self.client.exec_command, cmd)
+        cmd = f"{self._env_prefix()} gnome-screenshot -f {screenshot_path}"
+        await self.connection.exec(cmd)
         # Wait for screenshot to be saved
         await asyncio.sleep(1)
+        if self.sftp is None:
+            self.sftp = await self.connection.open_sftp()
         # Download screenshot
         with io.BytesIO() as buf:
             await asyncio.to_thread(self.sftp.getfo, screenshot_path, buf)
@@ -76,92 +256,185 @@ class VMComputer(BaseComputer):
             img_bytes = buf.read()
         # Remove screenshot from VM
         await asyncio.to_thread(self.sftp.remove, screenshot_path)
-        # Encode as base64
-        return base64.b64encode(img_bytes).decode("utf-8")
+        return img_bytes
 
-    async def click(self, x: int, y: int, button: str = "left") -> None:
+    async def _grab(self) -> Frame:
+        await self._connect()
+        frame = None
+        async with self.capture_lock:
+            if self.capture_mode == "daemon":
+                for attempt in range(2):
+                    try:
+                        frame = await self._capture_frame()
+                        break
+                    except (ConnectionError, OSError, paramiko.SSHException):
+                        self._stop_capture()
+                        if not self.capture_worked:
+                            # The helper never came up, e.g. no python3 in the VM
+                            self.capture_mode = "gnome-screenshot"
+                            break
+                        # The channel died mid-session, reconnect and retry once,
+                        # then use gnome-screenshot for this frame only
+                        if attempt == 0:
+                            await self._reconnect()
+            if frame is None:
+                with tracing.span("vm.gnome_screenshot"):
+                    frame = Frame(await self._gnome_screenshot(), "png")
+        if frame.source_size:
+            self.size = frame.source_size
+        return frame
+
+    async def screenshot(self) -> Frame:
+        return await self._grab()
+
+    async def _start_input(self):
+        if self.input_channel is None:
+            self.input_channel = await self.connection.open_channel(f"{self._env_prefix()} sh 2>&1")
+
+    def _stop_input(self):
+        if self.input_channel is not None:
+            self.input_channel.close()
+        self.input_channel = None
+
+    async def _send_input(self, commands: list[str], timeout: float):
+        await self._start_input()
+        self.input_seq += 1
+        ack = f"__cua_ack__ {self.input_seq}"
+        script = "".join(f"{command}\n" for command in commands)
+        script += f'echo "{ack} $?"\n'
+        with tracing.span("vm.input", commands=len(commands)):
+            await self.input_channel.write(script.encode("utf-8"))
+            try:
+                return await asyncio.wait_for(self._read_ack(ack), timeout)
+            except asyncio.TimeoutError:
+                # The shell is stuck, e.g. on a command that never ends, start a fresh one next time
+                self._stop_input()
+                raise TimeoutError(f"No acknowledgement from the input shell after {timeout:.0f} seconds.")
+
+    async def _read_ack(self, ack: str) -> int:
+        while True:
+            line = (await self.input_channel.readline()).decode("utf-8", errors="replace")
+            if line.startswith(ack):
+                return int(line.split()[-1])
+
+    async def flush(self) -> None:
+        """Run all queued input commands in one round trip and wait for them to finish."""
+        if not self.input_queue:
+            return
         await self._connect()
+        async with self.input_lock:
+            commands, self.input_queue = self.input_queue, []
+            timeout = self.input_timeout + self.input_queue_time
+            self.input_queue_time = 0.0
+            try:
+                await self._send_input(commands, timeout)
+            except TimeoutError:
+                # Running the commands again would likely hang the same way
+                raise
+            except (ConnectionError, OSError, paramiko.SSHException):
+                # Retry once on a fresh shell in case the old channel went away
+                self._stop_input()
+                await self._reconnect()
+                await self._send_input(commands, timeout)
+
+    @contextlib.asynccontextmanager
+    async def batch(self):
+        """Queue actions issued inside the block and send them as a single round trip."""
+        self.batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            # Don't leave the failed block's actions to go out with the next one
+            if self.batch_depth == 1:
+                self.input_queue.clear()
+                self.input_queue_time = 0.0
+            raise
+        finally:
+            self.batch_depth -= 1
+        if self.batch_depth == 0:
+            await self.flush()
+
+    async def _xdotool(self, *commands: str) -> None:
+        self.input_queue.extend(f"xdotool {command}" for command in commands)
+        if self.batch_depth == 0:
+            await self.flush()
+
+    async def click(self, x: int, y: int, button: str = "left") -> None:
         btn = {"left": 1, "middle": 2, "right": 3}.get(button, 1)
-        display = ":0"
-        xauth = f"/home/{self.username}/.Xauthority"
-        cmd = f"DISPLAY={display} XAUTHORITY={xauth} xdotool mousemove {x} {y} click {btn}"
-        await asyncio.to_thread(self.client.exec_command, cmd)
+        await self._xdotool(f"mousemove {x} {y} click {btn}")
 
     async def double_click(self, x: int, y: int) -> None:
-        await self._connect()
-        display = ":0"
-        xauth = f"/home/{self.username}/.Xauthority"
-        cmd = f"DISPLAY={display} XAUTHORITY={xauth} xdotool mousemove {x} {y} click --repeat 2 1"
-        await asyncio.to_thread(self.client.exec_command, cmd)
+        await self._xdotool(f"mousemove {x} {y} click --repeat 2 1")
 
     async def scroll(self, x: int, y: int, scroll_x: int, scroll_y: int) -> None:
-        await self._connect()
         # xdotool doesn't support scroll directly, but mouse wheel events are buttons 4 (up) and 5 (down)
         # Positive scroll_y = up, negative = down
-        display = ":0"
-        xauth = f"/home/{self.username}/.Xauthority"
+        commands = []
         if scroll_y != 0:
             btn = 4 if scroll_y > 0 else 5
-            for _ in range(abs(scroll_y)):
-                cmd = f"DISPLAY={display} XAUTHORITY={xauth} xdotool mousemove {x} {y} click {btn}"
-                await asyncio.to_thread(self.client.exec_command, cmd)
+            commands.append(f"mousemove {x} {y} click --repeat {abs(scroll_y)} --delay 10 {btn}")
         # For horizontal scroll, buttons 6 (left) and 7 (right)
         if scroll_x != 0:
             btn = 6 if scroll_x > 0 else 7
-            for _ in range(abs(scroll_x)):
-                cmd = f"DISPLAY={display} XAUTHORITY={xauth} xdotool mousemove {x} {y} click {btn}"
-                await asyncio.to_thread(self.client.exec_command, cmd)
+            commands.append(f"mousemove {x} {y} click --repeat {abs(scroll_x)} --delay 10 {btn}")
+        await self._xdotool(*commands)
+
+    def _type_delay(self, text: str) -> int:
+        if not text.isascii():
+            # Characters outside the keymap are remapped one by one, which needs more time
+            return max(self.type_delay_ms, 25)
+        return self.type_delay_ms
+
+    def _type_command(self, text: str) -> str:
+        return f"xdotool type --delay {self._type_delay(text)} -- {shlex.quote(text)}"
+
+    def _paste_command(self, text: str) -> str:
+        # Pasting a newline doesn't press Enter like typing it does, so press it in between
+        commands = []
+        for i, line in enumerate(text.split("\n")):
+            if i:
+                commands.append("xdotool key Return")
+            if line:
+                data = base64.b64encode(line.encode("utf-8")).decode("ascii")
+                commands.append(
+                    f"printf %s {data} | base64 -d | xclip -selection clipboard -i >/dev/null 2>&1"
+                    f" && sleep 0.05 && xdotool key --clearmodifiers {self.paste_keys}"
+                )
+        paste = " && ".join(commands)
+        # Type the text after all if the VM has no xclip
+        return f"if command -v xclip >/dev/null; then {paste}; else {self._type_command(text)}; fi"
 
     async def type(self, text: str) -> None:
-        await self._connect()
-        display = ":0"
-        xauth = f"/home/{self.username}/.Xauthority"
-        # Escape double quotes in text
-        safe_text = text.replace('"', r"\"")
-        cmd = f'DISPLAY={display} XAUTHORITY={xauth} xdotool type --delay 50 "{safe_text}"'
-        await asyncio.to_thread(self.client.exec_command, cmd)
+        if not text:
+            return
+        if self.paste_threshold is not None and len(text) >= self.paste_threshold:
+            self.input_queue.append(self._paste_command(text))
+        else:
+            self.input_queue.append(self._type_command(text))
+        # Pasting types the text too when the VM has no xclip
+        self.input_queue_time += len(text) * self._type_delay(text) / 1000
+        if self.batch_depth == 0:
+            await self.flush()
 
     async def wait(self, ms: int = 1000) -> None:
         await asyncio.sleep(ms / 1000)
 
     async def move(self, x: int, y: int) -> None:
-        await self._connect()
-        display = ":0"
-        xauth = f"/home/{self.username}/.Xauthority"
-        cmd = f"DISPLAY={display} XAUTHORITY={xauth} xdotool mousemove {x} {y}"
-        await asyncio.to_thread(self.client.exec_command, cmd)
+        await self._xdotool(f"mousemove {x} {y}")
 
     async def keypress(self, keys: list[str]) -> None:
-        await self._connect()
-        # Join keys for xdotool
-        display = ":0"
-        xauth = f"/home/{self.username}/.Xauthority"
-        key_str = " ".join(keys)
+        # Join keys for xdotool, quoted since the shell reads them
+        key_str = " ".join(shlex.quote(key) for key in keys)
         if("ENTER" in key_str):
             key_str = key_str.replace("ENTER", "Return")
-        cmd = f"DISPLAY={display} XAUTHORITY={xauth} xdotool key {key_str}"
-        await asyncio.to_thread(self.client.exec_command, cmd)
+        await self._xdotool(f"key {key_str}")
 
     async def drag(self, path: list[tuple[int, int]]) -> None:
-        await self._connect()
-        display = ":0"
-        xauth = f"/home/{self.username}/.Xauthority"
         if not path:
             return
-        # Move to start
+        # Chain the whole drag into one xdotool invocation
         x0, y0 = path[0]
-        await self.move(x0, y0)
-        # Mouse down
-        await asyncio.to_thread(
-            self.client.exec_command,
-            f"DISPLAY={display} XAUTHORITY={xauth} xdotool mousedown 1",
-        )
-        # Move along path
-        for x, y in path[1:]:
-            await self.move(x, y)
-            await asyncio.sleep(0.05)
-        # Mouse up
-        await asyncio.to_thread(
-            self.client.exec_command,
-            f"DISPLAY={display} XAUTHORITY={xauth} xdotool mouseup 1",
-        )
+        steps = [f"mousemove {x0} {y0} mousedown 1"]
+        steps += [f"mousemove {x} {y} sleep 0.05" for x, y in path[1:]]
+        steps.append("mouseup 1")
+        await self._xdotool(" ".join(steps))
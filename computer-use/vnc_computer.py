@@ -0,0 +1,370 @@
+import asyncio
+import io
+import struct
+
+import PIL.Image
+
+from basecomputer import BaseComputer
+from frame import Frame
+import tracing
+
+# Encodings the client asks for, the pseudo encoding lets the server resize the screen
+RAW = 0
+COPY_RECT = 1
+DESKTOP_SIZE = -223
+
+# Pointer button mask bits, scroll wheels are buttons 4 to 7
+buttons = {"left": 1, "middle": 2, "wheel": 2, "right": 4, "back": 128}
+SCROLL_UP, SCROLL_DOWN, SCROLL_LEFT, SCROLL_RIGHT = 8, 16, 32, 64
+
+# X keysyms, see keysymdef.h
+keysyms = {
+    "ctrl": 0xFFE3, "control": 0xFFE3, "shift": 0xFFE1, "alt": 0xFFE9, "option": 0xFFE9,
+    "cmd": 0xFFEB, "command": 0xFFEB, "super": 0xFFEB, "win": 0xFFEB, "meta": 0xFFEB,
+    "enter": 0xFF0D, "return": 0xFF0D, "esc": 0xFF1B, "escape": 0xFF1B,
+    "tab": 0xFF09, "space": 0x20, "backspace": 0xFF08, "delete": 0xFFFF, "del": 0xFFFF,
+    "insert": 0xFF63, "home": 0xFF50, "end": 0xFF57, "pageup": 0xFF55, "pagedown": 0xFF56,
+    "left": 0xFF51, "up": 0xFF52, "right": 0xFF53, "down": 0xFF54,
+    "arrowleft": 0xFF51, "arrowup": 0xFF52, "arrowright": 0xFF53, "arrowdown": 0xFF54,
+    "capslock": 0xFFE5, "printscreen": 0xFF61,
+}
+
+
+def char_keysym(char: str) -> int:
+    if char == "\n":
+        return keysyms["return"]
+    if char == "\t":
+        return keysyms["tab"]
+    code = ord(char)
+    if 0x20 <= code <= 0x7E or 0xA0 <= code <= 0xFF:
+        return code
+    return 0x01000000 | code
+
+
+def key_keysym(key: str) -> int:
+    if len(key) == 1:
+        return char_keysym(key)
+    name = key.lower()
+    if name in keysyms:
+        return keysyms[name]
+    if name[0] == "f" and name[1:].isdigit() and 1 <= int(name[1:]) <= 35:
+        return 0xFFBE + int(name[1:]) - 1
+    raise ValueError(f"Unsupported key '{key}'.")
+
+
+def vnc_response(password: str, challenge: bytes) -> bytes:
+    """Encrypt the VNC authentication challenge with DES, keyed by the password."""
+    try:
+        from cryptography.hazmat.decrepit.ciphers.algorithms import TripleDES
+    except ImportError:
+        from cryptography.hazmat.primitives.ciphers.algorithms import TripleDES
+    from cryptography.hazmat.primitives.ciphers import Cipher, modes
+    key = password.encode("latin-1")[:8].ljust(8, b"\0")
+    # VNC uses the bits of each key byte in reverse order
+    key = bytes(int(f"{byte:08b}"[::-1], 2) for byte in key)
+    # Triple DES with the same key three times is plain DES
+    encryptor = Cipher(TripleDES(key * 3), modes.ECB()).encryptor()
+    return encryptor.update(challenge) + encryptor.finalize()
+
+
+class VNCComputer(BaseComputer):
+    """Take screenshots and perform actions on a computer through its VNC server.
+
+    A local copy of the framebuffer is kept up to date from the rectangles the
+    server sends as the screen changes, so screenshots are read from it without
+    a round trip. Input goes over the same connection.
+    """
+
+    def __init__(self, hostname: str = "127.0.0.1", port: int = 5900, password: str | None = None,
+                 environment: str = "linux", shared: bool = True):
+        self.hostname = hostname
+        self.port = port
+        self.password = password
+        self._environment = environment
+        self.shared = shared
+        self.size = None
+        self.reader = None
+        self.writer = None
+        self.receiver = None
+        self.connect_lock = asyncio.Lock()
+        self.write_lock = asyncio.Lock()
+        # BGRX pixels of the whole screen, updated in place by the receiver task
+        self.framebuffer = None
+        # Bumped after every update that changed pixels, see wait_for_change
+        self.version = 0
+        self.changed = asyncio.Condition()
+        self.ready = asyncio.Event()
+        self.error = None
+
+    @property
+    def environment(self):
+        return self._environment
+
+    @property
+    def dimensions(self):
+        return self.size
+
+    async def _read(self, count: int) -> bytes:
+        return await self.reader.readexactly(count)
+
+    async def _handshake(self):
+        version = await self._read(12)
+        if not version.startswith(b"RFB "):
+            raise ConnectionError(f"{self.hostname}:{self.port} is not a VNC server.")
+        minor = min(int(version[8:11]), 8) if version[4:7] == b"003" else 8
+        if minor < 7:
+            # 3.5 and other unofficial versions speak 3.3
+            minor = 3
+        self.writer.write(b"RFB 003.%03d\n" % minor)
+        if minor >= 7:
+            (count,) = struct.unpack(">B", await self._read(1))
+            if count == 0:
+                await self._failed()
+            offered = await self._read(count)
+            security = 2 if self.password is not None and 2 in offered else 1
+            if security not in offered:
+                raise ConnectionError(f"No supported VNC security type among {list(offered)}.")
+            self.writer.write(struct.pack(">B", security))
+        else:
+            (security,) = struct.unpack(">I", await self._read(4))
+            if security == 0:
+                await self._failed()
+        if security == 2:
+            if self.password is None:
+                raise ConnectionError("The VNC server needs a password.")
+            self.writer.write(vnc_response(self.password, await self._read(16)))
+        if security == 2 or minor >= 8:
+            (result,) = struct.unpack(">I", await self._read(4))
+            if result != 0:
+                if minor >= 8:
+                    await self._failed()
+                raise ConnectionError("VNC authentication failed.")
+        self.writer.write(struct.pack(">B", 1 if self.shared else 0))
+        width, height = struct.unpack(">HH", await self._read(4))
+        await self._read(16)
+        (name_length,) = struct.unpack(">I", await self._read(4))
+        await self._read(name_length)
+        self._resize(width, height)
+        # 32 bit little endian true colour, so each pixel is B, G, R, X in memory
+        self.writer.write(struct.pack(">B3xBBBBHHHBBB3x", 0, 32, 24, 0, 1, 255, 255, 255, 16, 8, 0))
+        encodings = (COPY_RECT, RAW, DESKTOP_SIZE)
+        self.writer.write(struct.pack(f">BxH{len(encodings)}i", 2, len(encodings), *encodings))
+        self._request_update(incremental=False)
+        await self.writer.drain()
+
+    async def _failed(self):
+        (length,) = struct.unpack(">I", await self._read(4))
+        reason = (await self._read(length)).decode("utf-8", "replace")
+        raise ConnectionError(f"VNC server refused the connection: {reason}")
+
+    def _resize(self, width: int, height: int):
+        self.size = (width, height)
+        self.framebuffer = bytearray(width * height * 4)
+
+    def _request_update(self, incremental: bool = True):
+        width, height = self.size
+        self.writer.write(struct.pack(">BBHHHH", 3, int(incremental), 0, 0, width, height))
+
+    async def _connect(self):
+        async with self.connect_lock:
+            if self.receiver is not None and not self.receiver.done():
+                return
+            self.error = None
+            self.ready.clear()
+            with tracing.span("vnc.connect"):
+                self.reader, self.writer = await asyncio.open_connection(self.hostname, self.port)
+                try:
+                    await self._handshake()
+                except (asyncio.IncompleteReadError, ValueError) as e:
+                    self.writer.close()
+                    raise ConnectionError(f"VNC handshake with {self.hostname}:{self.port} failed.") from e
+                except BaseException:
+                    self.writer.close()
+                    raise
+            self.receiver = asyncio.create_task(self._receive())
+
+    async def _receive(self):
+        """Apply the messages from the server to the framebuffer until the connection ends."""
+        try:
+            while True:
+                (message_type,) = struct.unpack(">B", await self._read(1))
+                if message_type == 0:
+                    await self._update()
+                elif message_type == 1:
+                    # Colour map entries, unused with true colour
+                    _, _, count = struct.unpack(">xHH", await self._read(5))
+                    await self._read(count * 6)
+                elif message_type == 2:
+                    # Bell
+                    pass
+                elif message_type == 3:
+                    (length,) = struct.unpack(">3xI", await self._read(7))
+                    await self._read(length)
+                else:
+                    raise ConnectionError(f"Unknown VNC message type {message_type}.")
+        except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+            self.error = e
+        finally:
+            self.writer.close()
+            # Wake up everyone waiting for a frame or a change, they'll see the error
+            self.ready.set()
+            async with self.changed:
+                self.changed.notify_all()
+
+    async def _update(self):
+        (count,) = struct.unpack(">xH", await self._read(3))
+        resized = False
+        with tracing.span("vnc.update", rects=count):
+            for _ in range(count):
+                x, y, width, height, encoding = struct.unpack(">HHHHi", await self._read(12))
+                if encoding == RAW:
+                    self._blit(x, y, width, height, await self._read(width * height * 4))
+                elif encoding == COPY_RECT:
+                    source_x, source_y = struct.unpack(">HH", await self._read(4))
+                    self._copy(source_x, source_y, x, y, width, height)
+                elif encoding == DESKTOP_SIZE:
+                    self._resize(width, height)
+                    resized = True
+                else:
+                    raise ConnectionError(f"Unsupported VNC encoding {encoding}.")
+        self.version += 1
+        self.ready.set()
+        # Ask for the next change right away, the server answers once there is one
+        self._request_update(incremental=not resized)
+        await self.writer.drain()
+        async with self.changed:
+            self.changed.notify_all()
+
+    def _blit(self, x: int, y: int, width: int, height: int, pixels: bytes):
+        stride = self.size[0] * 4
+        row = width * 4
+        if x == 0 and width == self.size[0]:
+            self.framebuffer[y * stride:(y + height) * stride] = pixels
+            return
+        pixels = memoryview(pixels)
+        for line in range(height):
+            start = (y + line) * stride + x * 4
+            self.framebuffer[start:start + row] = pixels[line * row:(line + 1) * row]
+
+    def _copy(self, source_x: int, source_y: int, x: int, y: int, width: int, height: int):
+        stride = self.size[0] * 4
+        row = width * 4
+        framebuffer = memoryview(self.framebuffer)
+        # Copy the rows out first since the source and the target may overlap
+        rows = []
+        for line in range(height):
+            start = (source_y + line) * stride + source_x * 4
+            rows.append(bytes(framebuffer[start:start + row]))
+        framebuffer.release()
+        for line, pixels in enumerate(rows):
+            start = (y + line) * stride + x * 4
+            self.framebuffer[start:start + row] = pixels
+
+    async def _frame_ready(self):
+        await self._connect()
+        await self.ready.wait()
+        if self.error is not None:
+            raise ConnectionError(f"Lost the VNC connection to {self.hostname}:{self.port}.") from self.error
+
+    async def warm(self) -> None:
+        await self._connect()
+
+    async def fetch_dimensions(self) -> tuple[int, int]:
+        await self._connect()
+        return self.size
+
+    async def wait_for_change(self, version: int | None = None, timeout: float | None = None) -> int:
+        """Wait until the screen changes after version, by default the current one.
+
+        Returns the new version, or the current one if timeout seconds pass first.
+        """
+        await self._frame_ready()
+        version = self.version if version is None else version
+        async with self.changed:
+            try:
+                await asyncio.wait_for(
+                    self.changed.wait_for(lambda: self.version != version or self.error is not None), timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self.error is not None:
+            raise ConnectionError(f"Lost the VNC connection to {self.hostname}:{self.port}.") from self.error
+        return self.version
+
+    async def grab(self, region: tuple[int, int, int, int] | None = None) -> PIL.Image.Image:
+        """Return the framebuffer, or the (left, top, width, height) region of it, as an RGB image."""
+        await self._frame_ready()
+        image = PIL.Image.frombytes("RGB", self.size, bytes(self.framebuffer), "raw", "BGRX")
+        if region:
+            left, top, width, height = region
+            image = image.crop((left, top, left + width, top + height))
+        return image
+
+    async def screenshot(self) -> Frame:
+        image = await self.grab()
+        buffer = io.BytesIO()
+        with tracing.span("vnc.encode"):
+            await asyncio.to_thread(image.save, buffer, format="PNG")
+        return Frame(buffer.getvalue(), "png", image.size)
+
+    async def _send(self, *messages: bytes):
+        await self._connect()
+        async with self.write_lock:
+            self.writer.writelines(messages)
+            await self.writer.drain()
+
+    def _pointer(self, x: int, y: int, mask: int = 0) -> bytes:
+        return struct.pack(">BBHH", 5, mask, max(0, x), max(0, y))
+
+    def _key(self, keysym: int, down: bool) -> bytes:
+        return struct.pack(">BBxxI", 4, int(down), keysym)
+
+    async def click(self, x: int, y: int, button: str = "left") -> None:
+        mask = buttons.get(button, 1)
+        await self._send(self._pointer(x, y), self._pointer(x, y, mask), self._pointer(x, y))
+
+    async def double_click(self, x: int, y: int) -> None:
+        await self._send(self._pointer(x, y), *[self._pointer(x, y, mask) for mask in (1, 0, 1, 0)])
+
+    async def scroll(self, x: int, y: int, scroll_x: int, scroll_y: int) -> None:
+        messages = [self._pointer(x, y)]
+        for amount, negative, positive in ((scroll_y, SCROLL_UP, SCROLL_DOWN), (scroll_x, SCROLL_LEFT, SCROLL_RIGHT)):
+            mask = positive if amount > 0 else negative
+            for _ in range(abs(amount)):
+                messages += [self._pointer(x, y, mask), self._pointer(x, y)]
+        await self._send(*messages)
+
+    async def type(self, text: str) -> None:
+        messages = []
+        for char in text:
+            keysym = char_keysym(char)
+            messages += [self._key(keysym, True), self._key(keysym, False)]
+        await self._send(*messages)
+
+    async def wait(self, ms: int = 1000) -> None:
+        await asyncio.sleep(ms / 1000)
+
+    async def move(self, x: int, y: int) -> None:
+        await self._send(self._pointer(x, y))
+
+    async def keypress(self, keys: list[str]) -> None:
+        codes = [key_keysym(key) for key in keys]
+        messages = [self._key(keysym, True) for keysym in codes]
+        messages += [self._key(keysym, False) for keysym in reversed(codes)]
+        await self._send(*messages)
+
+    async def drag(self, path: list[tuple[int, int]]) -> None:
+        if len(path) < 2:
+            return
+        messages = [self._pointer(*path[0]), self._pointer(*path[0], 1)]
+        messages += [self._pointer(x, y, 1) for x, y in path[1:]]
+        messages.append(self._pointer(*path[-1]))
+        await self._send(*messages)
+
+    async def close(self):
+        if self.receiver is not None:
+            self.receiver.cancel()
+            try:
+                await self.receiver
+            except asyncio.CancelledError:
+                pass
+            self.receiver = None